@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+PyMon Agent - Persistent local upload daemon
+Usage: pymon agent [start|status|stop]
+
+Holds the parsed config and a keep-alive connection pool to the collector.
+Runners hand their payloads over a local Unix socket and the agent uploads
+them in batches, so short scripts skip config parsing and TLS handshakes.
+"""
+
+import sys
+import os
+import json
+import signal
+import socket
+import socketserver
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from runner import load_config, default_agent_socket, is_own_socket
+
+# Payloads held while the collector is unreachable; beyond either bound runners upload directly
+MAX_PENDING = 1000
+MAX_PENDING_BYTES = 64 * 1024 * 1024
+
+# Responses that say "try again later"; other 4xx mean the payload will never be accepted
+RETRYABLE_STATUS = (408, 429, 502, 503, 504)
+
+# Server errors on a single payload, while the rest of its batch got through, before it is dropped
+MAX_PAYLOAD_ATTEMPTS = 3
+
+
+def batch_url_for(service_url):
+    """Bulk ingest endpoint that sits next to the /post endpoint"""
+    return service_url.rstrip('/') + '/batch'
+
+
+class BatchUploader:
+    """Queue payloads and upload them to the collector in batches over one pooled session"""
+
+    def __init__(self, config):
+        self.service_url = config['server_url']
+        self.batch_url = batch_url_for(self.service_url)
+        self.timeout = config['timeout']
+        self.batch_size = max(1, config['agent_batch_size'])
+        self.flush_interval = config['agent_flush_interval']
+
+        # One session for the lifetime of the uploader keeps TLS connections warm
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config['agent_pool_size'])
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'User-Agent': 'PyMon-Agent/1.0'
+        })
+
+        # Older collectors have no /post/batch, fall back to one POST per payload
+        self.batch_supported = True
+
+        self.pending = []
+        self.pending_bytes = 0
+        # Encoded size per payload, keyed by id() while the payload is queued or in flight
+        self.sizes = {}
+        self.cond = threading.Condition()
+        self.stopped = False
+        self.thread = None
+        # Server errors per payload, keyed by id() like sizes
+        self.attempts = {}
+        # Payloads that got a server error on their own during the current upload
+        self.suspects = set()
+        self.stats = {'queued': 0, 'sent': 0, 'failed': 0, 'batches': 0, 'dropped': 0, 'rejected': 0}
+
+    def start(self):
+        """Start the background flush thread"""
+        self.thread = threading.Thread(target=self._run, name='pymon-uploader', daemon=True)
+        self.thread.start()
+
+    def submit(self, payload, size=None):
+        """Queue a payload for the next batch, returns the number of pending payloads or None when full"""
+        if size is None:
+            size = len(json.dumps(payload))
+        with self.cond:
+            if len(self.pending) >= MAX_PENDING or (self.pending and self.pending_bytes + size > MAX_PENDING_BYTES):
+                self.stats['rejected'] += 1
+                return None
+            self.pending.append(payload)
+            self.pending_bytes += size
+            self.sizes[id(payload)] = size
+            self.stats['queued'] += 1
+            if len(self.pending) >= self.batch_size:
+                self.cond.notify()
+            return len(self.pending)
+
+    def stop(self):
+        """Stop the flush thread and upload whatever is still pending"""
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+        self.session.close()
+        if self.pending:
+            print(f"⚠️  {len(self.pending)} run(s) could not be uploaded and were dropped")
+
+    def flush(self):
+        """Upload every pending payload now"""
+        while True:
+            with self.cond:
+                batch = self._take_batch()
+            if not batch:
+                return
+            if not self._upload(batch):
+                return
+
+    def _run(self):
+        while True:
+            with self.cond:
+                if not self.stopped and len(self.pending) < self.batch_size:
+                    self.cond.wait(timeout=self.flush_interval)
+                if self.stopped:
+                    return
+                batch = self._take_batch()
+            if batch and not self._upload(batch):
+                # Back off before retrying while the collector is unreachable
+                time.sleep(self.flush_interval)
+
+    def _take_batch(self):
+        """Remove the next batch from the queue, with the lock held"""
+        batch = self.pending[:self.batch_size]
+        del self.pending[:self.batch_size]
+        self.pending_bytes -= sum(self.sizes[id(payload)] for payload in batch)
+        return batch
+
+    def _upload(self, batch):
+        """Send one batch and requeue what is worth retrying; returns False when the caller should back off"""
+        retry = self._deliver(batch)
+        suspects = [payload for payload in retry if id(payload) in self.suspects]
+        self.suspects.clear()
+        if not retry:
+            return True
+
+        # Only when the rest of the batch got through is a server error this payload's fault;
+        # otherwise the collector itself is failing and nobody's attempts are used up
+        if len(retry) < len(batch):
+            for payload in suspects:
+                attempts = self.attempts.get(id(payload), 0) + 1
+                if attempts >= MAX_PAYLOAD_ATTEMPTS:
+                    retry.remove(payload)
+                    self._drop([payload], f"server error on {attempts} attempts")
+                else:
+                    self.attempts[id(payload)] = attempts
+            if not retry:
+                return True
+
+        self.stats['failed'] += len(retry)
+        kept = 0
+        with self.cond:
+            room = max(0, MAX_PENDING - len(self.pending))
+            budget = MAX_PENDING_BYTES - self.pending_bytes
+            for payload in retry[:room]:
+                if self.sizes[id(payload)] > budget and (kept or self.pending):
+                    break
+                budget -= self.sizes[id(payload)]
+                kept += 1
+            self.pending[:0] = retry[:kept]
+            self.pending_bytes += sum(self.sizes[id(payload)] for payload in retry[:kept])
+        if len(retry) > kept:
+            self._drop(retry[kept:], "the pending queue is full")
+        return False
+
+    def _deliver(self, batch):
+        """POST a batch, or its payloads one by one without batch support; returns the payloads to retry"""
+        if self.batch_supported:
+            return self._send(self.batch_url, {'payloads': batch}, batch)
+
+        retry = []
+        for index, payload in enumerate(batch):
+            if self._send(self.service_url, payload, [payload]):
+                if id(payload) not in self.suspects:
+                    # Unreachable or busy, the rest waits for the next attempt
+                    return retry + batch[index:]
+                retry.append(payload)
+        return retry
+
+    def _send(self, url, body, batch):
+        """One POST and what its response means for the payloads in it; returns the payloads to retry"""
+        try:
+            response = self.session.post(url, json=body, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            print(f"⚠️  Upload of {len(batch)} run(s) failed: {str(e)}")
+            return batch
+
+        status = response.status_code
+        if status < 400:
+            for payload in batch:
+                self.attempts.pop(id(payload), None)
+                self.sizes.pop(id(payload), None)
+            self.stats['sent'] += len(batch)
+            self.stats['batches'] += 1
+            print(f"✅ Uploaded {len(batch)} run(s) to {self.service_url}")
+            return []
+
+        if url == self.batch_url and status in (404, 405):
+            print("⚠️  Collector has no batch endpoint, uploading payloads one by one")
+            self.batch_supported = False
+            return self._deliver(batch)
+
+        if status in RETRYABLE_STATUS:
+            print(f"⚠️  Upload of {len(batch)} run(s) deferred: HTTP {status}")
+            return batch
+
+        if status < 500:
+            # Malformed or too large, sending it again cannot succeed
+            self._drop(batch, f"rejected with HTTP {status}: {response.text[:200]}")
+            return []
+
+        # A server error may come from a single bad payload: bisect the batch so the rest gets through
+        if len(batch) > 1:
+            middle = len(batch) // 2
+            first = self._deliver(batch[:middle])
+            if len(first) == middle and not all(id(payload) in self.suspects for payload in first):
+                # The collector deferred or could not be reached, the second half waits too
+                return first + batch[middle:]
+            return first + self._deliver(batch[middle:])
+
+        # Counted by _upload() once it knows whether the rest of the batch got through
+        self.suspects.add(id(batch[0]))
+        print(f"⚠️  Upload of 1 run failed: HTTP {status}")
+        return batch
+
+    def _drop(self, batch, reason):
+        for payload in batch:
+            self.attempts.pop(id(payload), None)
+            self.sizes.pop(id(payload), None)
+        self.stats['dropped'] += len(batch)
+        print(f"❌ Dropped {len(batch)} run(s): {reason}")
+
+
+class AgentRequestHandler(socketserver.StreamRequestHandler):
+    """One JSON message per line: a payload to queue, a status query or a stop request"""
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+
+        try:
+            message = json.loads(line)
+        except ValueError:
+            self._reply({'status': 'error', 'message': 'invalid JSON'})
+            return
+
+        uploader = self.server.uploader
+        kind = message.get('type')
+
+        if kind == 'payload':
+            payload = message.get('payload')
+            if not isinstance(payload, dict):
+                self._reply({'status': 'error', 'message': 'payload must be a JSON object'})
+                return
+            pending = uploader.submit(payload, size=len(line))
+            if pending is None:
+                # Backlogged, the runner uploads directly instead
+                self._reply({'status': 'full', 'pending': MAX_PENDING})
+            else:
+                self._reply({'status': 'queued', 'pending': pending})
+        elif kind == 'status':
+            with uploader.cond:
+                pending = len(uploader.pending)
+                pending_bytes = uploader.pending_bytes
+            self._reply({
+                'status': 'running',
+                'pid': os.getpid(),
+                'server_url': uploader.service_url,
+                'pending': pending,
+                'pending_bytes': pending_bytes,
+                'uptime': round(time.time() - self.server.started_at, 1),
+                **uploader.stats
+            })
+        elif kind == 'stop':
+            self._reply({'status': 'stopping'})
+            threading.Thread(target=self.server.shutdown).start()
+        else:
+            self._reply({'status': 'error', 'message': f'unknown message type: {kind}'})
+
+    def _reply(self, data):
+        self.wfile.write((json.dumps(data) + '\n').encode('utf-8'))
+
+
+class AgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, uploader):
+        self.uploader = uploader
+        self.started_at = time.time()
+        super().__init__(socket_path, AgentRequestHandler)
+
+
+def query_agent(socket_path, message, timeout=5):
+    """Send a control message to a running agent, returns its reply or None"""
+    if not is_own_socket(socket_path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+            reply = sock.makefile('rb').readline()
+        return json.loads(reply) if reply else None
+    except (OSError, ValueError):
+        return None
+
+
+def prepare_socket_dir(socket_path):
+    """Create the socket's directory, private to this user; refuse one owned by someone else"""
+    socket_dir = os.path.dirname(os.path.abspath(socket_path))
+    os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+    if os.stat(socket_dir).st_uid != os.getuid():
+        raise PermissionError(f"{socket_dir} belongs to another user")
+    if socket_dir == os.path.dirname(default_agent_socket()):
+        os.chmod(socket_dir, 0o700)
+
+
+def run_agent(config):
+    """Run the agent in the foreground until SIGINT/SIGTERM or a stop message"""
+    socket_path = config['agent_socket']
+
+    try:
+        prepare_socket_dir(socket_path)
+    except OSError as e:
+        print(f"❌ Cannot use socket directory for {socket_path}: {e}")
+        sys.exit(1)
+
+    if os.path.lexists(socket_path):
+        if not is_own_socket(socket_path):
+            print(f"❌ {socket_path} exists and is not a socket owned by you, refusing to replace it")
+            sys.exit(1)
+        if query_agent(socket_path, {'type': 'status'}) is not None:
+            print(f"⚠️  PyMon agent is already running on {socket_path}")
+            sys.exit(1)
+        # Stale socket left behind by an agent that did not shut down cleanly
+        os.unlink(socket_path)
+
+    uploader = BatchUploader(config)
+    uploader.start()
+
+    # The socket is created by bind(), so it must never exist with looser permissions
+    previous_umask = os.umask(0o177)
+    try:
+        server = AgentServer(socket_path, uploader)
+    finally:
+        os.umask(previous_umask)
+
+    def handle_signal(signum, frame):
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    print("🚀 PyMon agent running")
+    print(f"🔌 Socket:     {socket_path}")
+    print(f"🌐 Server:     {config['server_url']}")
+    print(f"📦 Batching:   {uploader.batch_size} runs / {uploader.flush_interval}s")
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        print("🔴 Stopping agent, flushing pending uploads...")
+        uploader.stop()
+        print(f"✅ Agent stopped ({uploader.stats['sent']} run(s) uploaded)")
+
+
+def main():
+    if not hasattr(socket, 'AF_UNIX'):
+        print("❌ Error: the pymon agent needs Unix domain sockets")
+        sys.exit(1)
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'start'
+    config = load_config()
+    socket_path = config['agent_socket']
+
+    if command == 'start':
+        run_agent(config)
+    elif command == 'status':
+        reply = query_agent(socket_path, {'type': 'status'})
+        if reply is None:
+            print(f"❌ PyMon agent is not running ({socket_path})")
+            sys.exit(1)
+        print("📊 PyMon Agent Status")
+        print("=" * 50)
+        print(f"✅ PID:        {reply['pid']}")
+        print(f"🌐 Server:     {reply['server_url']}")
+        print(f"⏱️  Uptime:     {reply['uptime']}s")
+        print(f"📥 Queued:     {reply['queued']}")
+        print(f"📤 Uploaded:   {reply['sent']} in {reply['batches']} batch(es)")
+        print(f"⏳ Pending:    {reply['pending']} ({reply.get('pending_bytes', 0) / 1024 / 1024:.1f} MiB)")
+        print(f"⚠️  Failed:     {reply['failed']} attempt(s), retried")
+        print(f"❌ Dropped:    {reply['dropped']}")
+        print(f"🚫 Rejected:   {reply['rejected']} (queue full, uploaded directly)")
+    elif command == 'stop':
+        reply = query_agent(socket_path, {'type': 'stop'})
+        if reply is None:
+            print(f"⚠️  PyMon agent is not running ({socket_path})")
+            sys.exit(1)
+        print("🔴 PyMon agent stopping")
+    else:
+        print("Usage: pymon agent [start|status|stop]")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
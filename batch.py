@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+PyMon Batch - Run many monitored scripts at once
+Usage: pymon batch <jobs.txt> [-j N] [--no-upload]
+
+Each non-empty line of the job file is one command line (`train.py --lr 0.1`).
+All children share one selector loop for their pipes, one metrics sampler
+and one batched uploader, and a summary table is printed at the end.
+"""
+
+import sys
+import os
+import argparse
+import codecs
+import selectors
+import shlex
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+from runner import load_config, get_system_metrics, build_run_report, build_payload, format_command
+from output_policy import StreamPolicy, format_output_stats
+
+READ_CHUNK = 65536
+
+
+class MetricsSampler:
+    """Keep a recent system metrics snapshot for every job to read, instead of sampling per job"""
+
+    def __init__(self):
+        self.latest = get_system_metrics()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='pymon-sampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def snapshot(self):
+        return dict(self.latest)
+
+    def _run(self):
+        # get_system_metrics() blocks for its one second CPU interval, which paces the loop
+        while not self.stopped.is_set():
+            self.latest = get_system_metrics()
+
+
+class PartialLine:
+    """The unfinished last line of one pipe, held only up to the policy's line cap
+
+    Past the cap the rest of the line goes straight to the terminal and is
+    only counted, so a huge line without newlines costs no memory.
+    """
+
+    def __init__(self, prefix, out, max_bytes):
+        self.prefix = prefix
+        self.out = out
+        self.max_bytes = max_bytes
+        self.parts = []
+        self.size = 0
+        self.cut = 0
+        # Set once the line spilled to the terminal, keeps split UTF-8 sequences intact
+        self.decoder = None
+
+    def __bool__(self):
+        return bool(self.size or self.cut)
+
+    def append(self, data):
+        if not data:
+            return
+        if self.decoder is None:
+            if not self.max_bytes or self.size + len(data) <= self.max_bytes:
+                self.parts.append(data)
+                self.size += len(data)
+                return
+            keep = self.max_bytes - self.size
+            self.parts.append(data[:keep])
+            self.size += keep
+            data = data[keep:]
+            self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            self.out.write(self.prefix + self.decoder.decode(b''.join(self.parts)))
+        self.cut += len(data)
+        self.out.write(self.decoder.decode(data))
+
+    def take(self):
+        """The held part of the line and the number of bytes cut from it, then start a new line"""
+        text = b''.join(self.parts).decode('utf-8', errors='replace')
+        cut = self.cut
+        if self.decoder is not None:
+            self.out.write(self.decoder.decode(b'', final=True) + '\n')
+        self.parts = []
+        self.size = 0
+        self.cut = 0
+        self.decoder = None
+        return text, cut
+
+
+class Job:
+    """One command line from the job file and everything captured while it runs"""
+
+    def __init__(self, number, command_line, config=None):
+        self.number = number
+        self.command_line = command_line
+        self.error = None
+        self.return_code = None
+        try:
+            args = shlex.split(command_line)
+        except ValueError as e:
+            # Reported in the summary like a command that failed to start
+            args = []
+            self.error = f"cannot parse job line: {e}"
+            self.return_code = -1
+        # Recorded exactly as runner.py records a single run of the same command
+        self.command = format_command(args)
+        # Python scripts run under the same interpreter as pymon itself
+        if args and args[0].endswith('.py'):
+            args = [sys.executable] + args
+        self.args = args
+
+        self.process = None
+        self.open_streams = 0
+        self.policies = {'stdout': StreamPolicy.from_config(config), 'stderr': StreamPolicy.from_config(config)}
+        self.partials = {
+            stream: PartialLine(f"[{number}] ", sys.stdout if stream == 'stdout' else sys.stderr,
+                                self.policies[stream].max_line_bytes)
+            for stream in ('stdout', 'stderr')
+        }
+        self.start_time = None
+        self.end_time = None
+        self.metrics_before = None
+
+    def feed(self, stream, chunk):
+        """Split a raw pipe chunk into lines, tee them to the terminal and keep what the policy allows"""
+        # Only the new chunk is split, a long line is never rescanned on later reads
+        first, *rest = chunk.split(b'\n')
+        self.partials[stream].append(first)
+        if not rest:
+            return
+        self._finish_line(stream, '\n')
+        *complete, last = rest
+        for raw in complete:
+            self._emit(stream, raw.decode('utf-8', errors='replace') + '\n')
+        self.partials[stream].append(last)
+
+    def close_stream(self, stream):
+        """Flush a trailing line that had no newline"""
+        if self.partials[stream]:
+            self._finish_line(stream, '')
+        self.open_streams -= 1
+
+    def _finish_line(self, stream, ending):
+        text, cut = self.partials[stream].take()
+        if cut:
+            # Already on the terminal, the policy only sees the capped start
+            self.policies[stream].add(text + ending, cut=cut)
+        else:
+            self._emit(stream, text + ending)
+
+    def _emit(self, stream, line):
+        out = sys.stdout if stream == 'stdout' else sys.stderr
+        text = line if line.endswith('\n') else line + '\n'
+        out.write(f"[{self.number}] {text}")
+        self.policies[stream].add(line)
+
+
+def read_jobs(path, config=None):
+    """Read command lines from the job file, skipping blanks and # comments"""
+    jobs = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            jobs.append(Job(len(jobs) + 1, line, config))
+    return jobs
+
+
+def start_job(job, selector, sampler, cwd):
+    """Spawn a job's child process and register its pipes with the selector"""
+    if job.error:
+        return False
+    job.metrics_before = sampler.snapshot()
+    job.start_time = datetime.now()
+    try:
+        job.process = subprocess.Popen(job.args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd)
+    except OSError as e:
+        job.error = str(e)
+        job.return_code = -1
+        job.end_time = datetime.now()
+        return False
+
+    for stream, pipe in (('stdout', job.process.stdout), ('stderr', job.process.stderr)):
+        os.set_blocking(pipe.fileno(), False)
+        selector.register(pipe, selectors.EVENT_READ, (job, stream))
+        job.open_streams += 1
+    return True
+
+
+def finish_job(job, sampler, uploader, cwd, hostname):
+    """Reap a job whose pipes are closed and hand its report to the uploader"""
+    job.return_code = job.process.wait()
+    job.end_time = datetime.now()
+
+    if uploader is None:
+        return
+
+    report = build_run_report(
+        job.command, cwd, hostname, job.start_time, job.end_time, job.return_code,
+        job.metrics_before, sampler.snapshot(),
+        job.policies['stdout'].text(), job.policies['stderr'].text(),
+        format_output_stats(job.policies)
+    )
+    if uploader.submit(build_payload(report)) is None:
+        print(f"⚠️  [{job.number}] Upload queue is full, run not uploaded")
+
+
+def run_batch(jobs, concurrency, sampler, uploader):
+    """Run all jobs with at most `concurrency` children alive, multiplexing every pipe in one loop"""
+    cwd = os.getcwd()
+    hostname = os.uname().nodename if hasattr(os, 'uname') else 'unknown'
+
+    selector = selectors.DefaultSelector()
+    pending = list(jobs)
+    running = []
+
+    while pending or running:
+        while pending and len(running) < concurrency:
+            job = pending.pop(0)
+            if start_job(job, selector, sampler, cwd):
+                running.append(job)
+
+        for key, _ in selector.select(timeout=0.5):
+            job, stream = key.data
+            try:
+                chunk = os.read(key.fd, READ_CHUNK)
+            except BlockingIOError:
+                continue
+            if chunk:
+                job.feed(stream, chunk)
+            else:
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+                job.close_stream(stream)
+
+        for job in [job for job in running if job.open_streams == 0]:
+            running.remove(job)
+            finish_job(job, sampler, uploader, cwd, hostname)
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    selector.close()
+
+
+def print_summary(jobs, elapsed):
+    """Print one row per job plus totals"""
+    width = min(max((len(job.command_line) for job in jobs), default=7), 50)
+
+    print(f"\n{'='*60}")
+    print(f"📊 Batch Summary")
+    print(f"{'='*60}")
+    print(f"{'#':>4}  {'':2} {'RC':>4}  {'Runtime':>10}  {'Out':>7}  {'Err':>7}  {'Command':<{width}}")
+    for job in jobs:
+        status = "✅" if job.return_code == 0 else "❌"
+        runtime = (job.end_time - job.start_time).total_seconds() if job.end_time else 0.0
+        command = job.command_line if len(job.command_line) <= width else job.command_line[:width - 3] + '...'
+        print(f"{job.number:>4}  {status} {job.return_code:>4}  {runtime:>9.2f}s  "
+              f"{job.policies['stdout'].counters['total_lines']:>7}  "
+              f"{job.policies['stderr'].counters['total_lines']:>7}  {command:<{width}}")
+        if job.error:
+            print(f"{'':>10}⚠️  {job.error}")
+
+    failed = sum(1 for job in jobs if job.return_code != 0)
+    print(f"{'='*60}")
+    print(f"✅ Succeeded: {len(jobs) - failed}   ❌ Failed: {failed}   ⏱️  Wall time: {elapsed:.2f}s")
+    print(f"{'='*60}\n")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='pymon batch', description='Run many monitored scripts at once')
+    parser.add_argument('jobs_file', help='file with one command line per job')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 4,
+                        help='maximum number of jobs running at the same time (default: CPU count)')
+    parser.add_argument('--no-upload', action='store_true', help='run and summarise without uploading')
+    options = parser.parse_args()
+
+    if not os.path.exists(options.jobs_file):
+        print(f"❌ Error: job file not found: {options.jobs_file}")
+        sys.exit(1)
+
+    config = load_config()
+    jobs = read_jobs(options.jobs_file, config)
+    if not jobs:
+        print(f"⚠️  No jobs in {options.jobs_file}")
+        sys.exit(0)
+
+    concurrency = max(1, options.jobs)
+
+    uploader = None
+    if not options.no_upload:
+        from agent import BatchUploader
+        uploader = BatchUploader(config)
+        uploader.start()
+
+    print(f"🔍 PyMon Batch - {len(jobs)} jobs, {concurrency} at a time")
+    print(f"{'='*60}\n")
+
+    sampler = MetricsSampler()
+    sampler.start()
+    started = time.monotonic()
+
+    try:
+        run_batch(jobs, concurrency, sampler, uploader)
+    except KeyboardInterrupt:
+        print("\n⚠️  Batch interrupted by user")
+        for job in jobs:
+            if job.process is not None and job.process.poll() is None:
+                job.process.terminate()
+        sys.exit(130)
+    finally:
+        sampler.stop()
+        if uploader is not None:
+            uploader.stop()
+
+    failed = print_summary(jobs, time.monotonic() - started)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Runner-side benchmarks
+
+- overhead: wall time added by `runner.py` around a script that does nothing
+- capture: MB/s pushed through the runner by a child that prints heavily
+- memory: peak runner RSS as a function of output size
+
+Uploads go to a local stand-in collector, so nothing leaves the machine.
+"""
+
+import sys
+import os
+import json
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psutil
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNNER_PATH = os.path.join(REPO_DIR, 'runner.py')
+
+NOOP_SCRIPT = "pass\n"
+
+# Prints `size_mb` megabytes of distinct ~100 byte lines, so repeat collapsing does not kick in
+SPAM_SCRIPT = """import sys
+size = int(float(sys.argv[1]) * 1024 * 1024)
+line_number = 0
+written = 0
+write = sys.stdout.write
+while written < size:
+    line = f"{line_number:>10} 2026-10-19 12:00:00 INFO step={line_number} loss=0.{line_number % 997:03d} " + "x" * 40 + "\\n"
+    write(line)
+    written += len(line)
+    line_number += 1
+"""
+
+
+class CollectorHandler(BaseHTTPRequestHandler):
+    """Accept /post and /post/batch like the real collector, without storing anything"""
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        self.server.bytes_received += length
+        self.server.requests += 1
+        body = json.dumps({'status': 'success', 'run_id': 'bench', 'total_logs': self.server.requests}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInCollector:
+    """Local HTTP collector on an ephemeral port"""
+
+    def __init__(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), CollectorHandler)
+        self.server.bytes_received = 0
+        self.server.requests = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/post"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def timed_run(args, env, sample_rss=False):
+    """Run a command with its output discarded, returns (wall seconds, peak RSS bytes of that process)"""
+    started = time.perf_counter()
+    process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+    peak_rss = 0
+    if sample_rss:
+        handle = psutil.Process(process.pid)
+        while process.poll() is None:
+            try:
+                peak_rss = max(peak_rss, handle.memory_info().rss)
+            except psutil.Error:
+                break
+            time.sleep(0.005)
+    process.wait()
+    return time.perf_counter() - started, peak_rss
+
+
+def require_uploads(collector, expected):
+    """Fail loudly if the runs just measured did not upload to the stand-in collector"""
+    received = collector.server.requests
+    collector.server.requests = 0
+    if received < expected:
+        raise RuntimeError(f"stand-in collector received {received} uploads, expected {expected}: "
+                           "the runner is not using PYMON_SERVER_URL, results would include a remote upload")
+
+
+def run(quick=False):
+    """Run the runner benchmarks, returns {metric: {'value', 'unit', 'better'}}"""
+    repeats = 3 if quick else 7
+    sizes_mb = [1, 10] if quick else [1, 10, 50]
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix='pymon-bench-') as workdir, StandInCollector() as collector:
+        noop = os.path.join(workdir, 'noop.py')
+        spam = os.path.join(workdir, 'spam.py')
+        with open(noop, 'w') as f:
+            f.write(NOOP_SCRIPT)
+        with open(spam, 'w') as f:
+            f.write(SPAM_SCRIPT)
+
+        env = dict(os.environ, PYMON_SERVER_URL=collector.url, PYMON_NO_AGENT='1')
+
+        # Added wall time per run
+        direct = [timed_run([sys.executable, noop], env)[0] for _ in range(repeats)]
+        monitored = [timed_run([sys.executable, RUNNER_PATH, noop], env)[0] for _ in range(repeats)]
+        results['runner.overhead_seconds'] = {
+            'value': round(statistics.median(monitored) - statistics.median(direct), 4),
+            'unit': 's', 'better': 'lower'
+        }
+        print(f"   runner overhead: {results['runner.overhead_seconds']['value']}s per run")
+        require_uploads(collector, repeats)
+
+        # Capture throughput and peak RSS against output size
+        for size in sizes_mb:
+            baseline = statistics.median(timed_run([sys.executable, spam, str(size)], env)[0] for _ in range(repeats))
+            walls = []
+            peaks = []
+            for _ in range(repeats):
+                wall, peak = timed_run([sys.executable, RUNNER_PATH, spam, str(size)], env, sample_rss=True)
+                walls.append(wall)
+                peaks.append(peak)
+
+            # Capture time excludes the fixed per-run overhead measured above
+            capture = max(statistics.median(walls) - baseline - results['runner.overhead_seconds']['value'], 1e-6)
+            results[f'runner.capture_mb_per_s.{size}mb'] = {
+                'value': round(size / capture, 2), 'unit': 'MB/s', 'better': 'higher'
+            }
+            results[f'runner.peak_rss_mb.{size}mb'] = {
+                'value': round(max(peaks) / (1024 * 1024), 1), 'unit': 'MB', 'better': 'lower'
+            }
+            print(f"   {size:>3} MB output: {results[f'runner.capture_mb_per_s.{size}mb']['value']} MB/s, "
+                  f"peak RSS {results[f'runner.peak_rss_mb.{size}mb']['value']} MB")
+            require_uploads(collector, repeats)
+
+    return results
@@ -0,0 +1,158 @@
+"""
+Multi-worker scaling benchmark
+
+Starts the collector under gunicorn with the gthread worker class of
+gunicorn.conf.py, but with its own settings: the worker count varied, 4
+threads, no METRICS_DIR and the default MongoDB pool size. Drives /post from
+separate client processes and reports requests per second for each worker
+count and the scaling efficiency against a single worker.
+
+Every worker gets its own in-memory fake_mongo store, so this measures how
+the collector's own work spreads over cores, not MongoDB. The load
+generator runs on the same machine, so worker counts stop at half the
+cores to leave it the other half.
+"""
+
+import sys
+import os
+import json
+import http.client
+import multiprocessing
+import socket
+import subprocess
+import time
+from datetime import datetime, timedelta
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PAYLOAD_BYTES = 10 * 1024
+# Replaced per request, the run ID comes from the payload and a repeat would be stored as a duplicate
+TIMESTAMP_MARK = b'@TIMESTAMP@'
+
+
+def serve(port, workers, threads):
+    """Run the collector under gunicorn on the in-memory client (blocks, used in a subprocess)"""
+    from gunicorn.app.base import BaseApplication
+    import pymongo
+    from fake_mongo import FakeMongoClient
+
+    os.environ['COMPACTION_INTERVAL'] = '0'
+    # Patched in the master, so every forked worker imports server.py against it
+    pymongo.MongoClient = FakeMongoClient
+    sys.path.insert(0, REPO_DIR)
+
+    class Collector(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'127.0.0.1:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', threads)
+            self.cfg.set('keepalive', 5)
+            self.cfg.set('loglevel', 'warning')
+
+        def load(self):
+            import server
+            return server.create_app()
+
+    Collector().run()
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def wait_until_up(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/')
+            if connection.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def client_loop(port, body, duration, counts, client):
+    """POST the payload, with a new timestamp each time, over one keep-alive connection until the time is up"""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    headers = {'Content-Type': 'application/json'}
+    prefix, suffix = body.split(TIMESTAMP_MARK)
+    started = datetime(2026, 10, 19) + timedelta(days=client)
+    completed = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        timestamp = (started + timedelta(microseconds=completed)).isoformat().encode('ascii')
+        connection.request('POST', '/post', body=prefix + timestamp + suffix, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        if response.status == 200:
+            completed += 1
+    counts.put(completed)
+
+
+def measure(workers, threads, clients, duration, body):
+    """Requests per second for one worker count"""
+    port = free_port()
+    code = f"import sys; sys.path.insert(0, {BENCH_DIR!r}); import bench_scaling; bench_scaling.serve({port}, {workers}, {threads})"
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=REPO_DIR,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_until_up(port):
+            raise RuntimeError(f"gunicorn with {workers} workers did not come up on port {port}")
+
+        # Warm every worker up (lazy MongoDB setup, imports) before timing
+        warmup = multiprocessing.Queue()
+        for client in range(workers * 2):
+            client_loop(port, body, 0.2, warmup, client)
+
+        counts = multiprocessing.Queue()
+        started = time.perf_counter()
+        loaders = [multiprocessing.Process(target=client_loop, args=(port, body, duration, counts, workers * 2 + client))
+                   for client in range(clients)]
+        for loader in loaders:
+            loader.start()
+        total = sum(counts.get() for _ in loaders)
+        for loader in loaders:
+            loader.join()
+        return total / (time.perf_counter() - started)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def run(quick=False, max_workers=None):
+    """Run the scaling benchmark, returns {metric: {'value', 'unit', 'better'}}"""
+    from bench_server import make_payload
+
+    max_workers = max_workers or max(1, (os.cpu_count() or 1) // 2)
+    worker_counts = []
+    count = 1
+    while count <= max_workers:
+        worker_counts.append(count)
+        count *= 2
+    if worker_counts[-1] != max_workers:
+        worker_counts.append(max_workers)
+
+    sys.path.insert(0, REPO_DIR)
+    body = json.dumps(dict(make_payload(PAYLOAD_BYTES), timestamp=TIMESTAMP_MARK.decode('ascii'))).encode('utf-8')
+    duration = 3 if quick else 10
+    threads = 4
+    results = {}
+    single = None
+
+    for workers in worker_counts:
+        # Enough concurrent connections to keep every worker thread busy
+        rps = measure(workers, threads, clients=workers * 2, duration=duration, body=body)
+        single = single or rps
+        results[f'scaling.post_rps.{workers}w'] = {'value': round(rps, 1), 'unit': 'req/s', 'better': 'higher'}
+        results[f'scaling.efficiency.{workers}w'] = {
+            'value': round(rps / (single * workers), 3), 'unit': 'ratio', 'better': 'higher'
+        }
+        print(f"   {workers:>3} workers x {threads} threads: {round(rps, 1)} req/s, "
+              f"efficiency {results[f'scaling.efficiency.{workers}w']['value']}")
+
+    return results
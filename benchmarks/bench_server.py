@@ -0,0 +1,125 @@
+"""
+Collector-side benchmarks
+
+- ingest: /post requests per second and p50/p99 latency against payload size
+- view: /view latency against collection size
+
+server.py runs in-process through Flask's test client on top of the
+in-memory fake_mongo client, so these numbers cover decoding, parsing,
+serialization and the request pipeline but not MongoDB itself.
+"""
+
+import sys
+import os
+import importlib
+import time
+from datetime import datetime, timedelta
+
+from fake_mongo import FakeMongoClient
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_server():
+    """Import server.py wired to the in-memory client, with background work and caching off"""
+    os.environ['COMPACTION_INTERVAL'] = '0'
+    os.environ['CACHE_TTL_SECONDS'] = '0'
+    os.environ['MONGODB_URI'] = 'mongodb://benchmark'
+
+    import pymongo
+    pymongo.MongoClient = FakeMongoClient
+    FakeMongoClient.reset()
+
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    if 'server' in sys.modules:
+        server = importlib.reload(sys.modules['server'])
+    else:
+        server = importlib.import_module('server')
+    server.init_mongodb(with_indexes=True)
+    return server
+
+
+def make_payload(size_bytes):
+    """A runner payload whose captured stdout is about `size_bytes` long"""
+    from runner import build_run_report, build_payload
+
+    line = "2026-10-19 12:00:00 | INFO step=000000 loss=0.4242 " + "x" * 40 + "\n"
+    stdout_text = line * max(1, size_bytes // len(line))
+    metrics = {'cpu_percent': 1.0, 'memory_used_mb': 2048.0, 'disk_percent': 42.0}
+    started = datetime(2026, 10, 19, 12, 0, 0)
+    report = build_run_report('runner.py bench.py', REPO_DIR, 'bench-host', started, started + timedelta(seconds=3),
+                              0, metrics, metrics, stdout_text, '', None)
+    return build_payload(report)
+
+
+def distinct_payloads(payload, count):
+    """`count` copies of a payload with their own timestamps, so each one is a new run and not a retry"""
+    started = datetime(2026, 10, 19, 12, 0, 0)
+    return [dict(payload, timestamp=(started + timedelta(microseconds=index)).isoformat()) for index in range(count)]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run(quick=False):
+    """Run the collector benchmarks, returns {metric: {'value', 'unit', 'better'}}"""
+    server = load_server()
+    client = server.app.test_client()
+    results = {}
+
+    # Ingest: fewer requests for bigger payloads keeps every size at a similar total volume
+    sizes_kb = [1, 100, 1024] if quick else [1, 10, 100, 1024, 5120]
+    for size_kb in sizes_kb:
+        requests_count = max(10, min(500, 20000 // size_kb)) // (4 if quick else 1)
+        payloads = distinct_payloads(make_payload(size_kb * 1024), requests_count)
+        stored_before = server.logs_collection.count_documents({})
+        latencies = []
+        started = time.perf_counter()
+        for payload in payloads:
+            request_started = time.perf_counter()
+            response = client.post('/post', json=payload)
+            latencies.append(time.perf_counter() - request_started)
+            assert response.status_code == 200, response.get_data(as_text=True)
+        elapsed = time.perf_counter() - started
+        stored = server.logs_collection.count_documents({}) - stored_before
+        assert stored == requests_count, f"{requests_count - stored} POSTs were stored as duplicates"
+
+        results[f'server.post_rps.{size_kb}kb'] = {
+            'value': round(requests_count / elapsed, 1), 'unit': 'req/s', 'better': 'higher'
+        }
+        results[f'server.post_p99_ms.{size_kb}kb'] = {
+            'value': round(percentile(latencies, 0.99) * 1000, 2), 'unit': 'ms', 'better': 'lower'
+        }
+        print(f"   POST {size_kb:>5} KB: {results[f'server.post_rps.{size_kb}kb']['value']} req/s, "
+              f"p99 {results[f'server.post_p99_ms.{size_kb}kb']['value']} ms")
+
+    # View: fill the collection directly, then page through the newest runs
+    collection_sizes = [100, 1000] if quick else [100, 1000, 10000]
+    payload = make_payload(4 * 1024)
+    repeats = 20 if quick else 50
+    for collection_size in collection_sizes:
+        server = load_server()
+        client = server.app.test_client()
+        for document_payload in distinct_payloads(payload, collection_size):
+            server.logs_collection.insert_one(server.build_structured_data(document_payload))
+
+        latencies = []
+        for _ in range(repeats):
+            request_started = time.perf_counter()
+            response = client.get('/view?page=1&limit=50')
+            latencies.append(time.perf_counter() - request_started)
+            assert response.status_code == 200, response.get_data(as_text=True)
+
+        results[f'server.view_p50_ms.{collection_size}'] = {
+            'value': round(percentile(latencies, 0.5) * 1000, 2), 'unit': 'ms', 'better': 'lower'
+        }
+        results[f'server.view_p99_ms.{collection_size}'] = {
+            'value': round(percentile(latencies, 0.99) * 1000, 2), 'unit': 'ms', 'better': 'lower'
+        }
+        print(f"   GET /view with {collection_size:>6} runs: p50 {results[f'server.view_p50_ms.{collection_size}']['value']} ms, "
+              f"p99 {results[f'server.view_p99_ms.{collection_size}']['value']} ms")
+
+    return results
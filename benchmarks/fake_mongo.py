@@ -0,0 +1,232 @@
+"""
+In-memory stand-in for the parts of MongoClient that server.py uses
+
+Lets the collector benchmarks run offline. Query support covers equality,
+$exists, $in and the range operators on (dotted) fields. Unique indexes are
+enforced like MongoDB does, so duplicate inserts fail the same way. Timings
+measured against it cover the server's own work, not MongoDB's.
+"""
+
+import copy
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+MISSING = object()
+
+
+def get_field(document, path):
+    value = document
+    for part in path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return MISSING
+        value = value[part]
+    return value
+
+
+def matches(document, query):
+    for path, condition in query.items():
+        value = get_field(document, path)
+        if isinstance(condition, dict) and any(key.startswith('$') for key in condition):
+            for operator, operand in condition.items():
+                if operator == '$exists':
+                    if (value is not MISSING) != bool(operand):
+                        return False
+                elif value is MISSING:
+                    return False
+                elif operator == '$in' and value not in operand:
+                    return False
+                elif operator == '$gt' and not value > operand:
+                    return False
+                elif operator == '$gte' and not value >= operand:
+                    return False
+                elif operator == '$lt' and not value < operand:
+                    return False
+                elif operator == '$lte' and not value <= operand:
+                    return False
+        elif value is MISSING or value != condition:
+            return False
+    return True
+
+
+def project(document, projection):
+    if not projection:
+        return copy.deepcopy(document)
+
+    include = {key for key, flag in projection.items() if flag and key != '_id'}
+    if include:
+        result = {}
+        if projection.get('_id', 1):
+            result['_id'] = document['_id']
+        for path in include:
+            value = get_field(document, path)
+            if value is MISSING:
+                continue
+            target = result
+            *parents, leaf = path.split('.')
+            for part in parents:
+                target = target.setdefault(part, {})
+            target[leaf] = copy.deepcopy(value)
+        return result
+
+    result = copy.deepcopy(document)
+    for key, flag in projection.items():
+        if not flag:
+            result.pop(key, None)
+    return result
+
+
+class FakeCursor:
+    def __init__(self, documents, projection):
+        self.documents = documents
+        self.projection = projection
+        self.skip_count = 0
+        self.limit_count = 0
+
+    def sort(self, key, direction=1):
+        self.documents = sorted(
+            self.documents,
+            key=lambda document: (get_field(document, key) is MISSING, get_field(document, key)),
+            reverse=direction < 0
+        )
+        return self
+
+    def skip(self, count):
+        self.skip_count = count
+        return self
+
+    def limit(self, count):
+        self.limit_count = count
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def close(self):
+        pass
+
+    def __iter__(self):
+        documents = self.documents[self.skip_count:]
+        if self.limit_count:
+            documents = documents[:self.limit_count]
+        for document in documents:
+            yield project(document, self.projection)
+
+
+class InsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+
+class FakeCollection:
+    def __init__(self, name):
+        self.name = name
+        self.documents = []
+        self.indexes = {'_id_': {'key': [('_id', 1)]}}
+        # Index name -> values already stored, for the unique indexes
+        self.unique_values = {'_id_': set()}
+
+    def create_index(self, keys, **options):
+        keys = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        name = options.pop('name', '_'.join(f"{key}_{direction}" for key, direction in keys))
+        self.indexes[name] = {'key': keys, **options}
+        if options.get('unique'):
+            self.unique_values[name] = {self._index_value(document, name) for document in self.documents}
+        return name
+
+    def index_information(self):
+        return copy.deepcopy(self.indexes)
+
+    def drop_index(self, name):
+        del self.indexes[name]
+        self.unique_values.pop(name, None)
+
+    def _index_value(self, document, name):
+        return tuple(repr(get_field(document, key)) for key, _ in self.indexes[name]['key'])
+
+    def insert_one(self, document):
+        document.setdefault('_id', ObjectId())
+        values = {name: self._index_value(document, name) for name in self.unique_values}
+        for name, value in values.items():
+            if value in self.unique_values[name]:
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {name}",
+                                        11000)
+        for name, value in values.items():
+            self.unique_values[name].add(value)
+        self.documents.append(copy.deepcopy(document))
+        return InsertOneResult(document['_id'])
+
+    def insert_many(self, documents, ordered=True):
+        errors = []
+        inserted = 0
+        for index, document in enumerate(documents):
+            try:
+                self.insert_one(document)
+                inserted += 1
+            except DuplicateKeyError as e:
+                errors.append({'index': index, 'code': 11000, 'errmsg': str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({'writeErrors': errors, 'writeConcernErrors': [], 'nInserted': inserted})
+
+    def count_documents(self, query):
+        if not query:
+            return len(self.documents)
+        return sum(1 for document in self.documents if matches(document, query))
+
+    def find(self, query=None, projection=None):
+        query = query or {}
+        documents = [document for document in self.documents if matches(document, query)] if query else list(self.documents)
+        return FakeCursor(documents, projection)
+
+    def find_one(self, query=None, projection=None):
+        for document in self.find(query, projection):
+            return document
+        return None
+
+    def distinct(self, path):
+        values = []
+        for document in self.documents:
+            value = get_field(document, path)
+            if value is not MISSING and value not in values:
+                values.append(value)
+        return values
+
+    def update_one(self, query, update):
+        for document in self.documents:
+            if matches(document, query):
+                document.update(update.get('$set', {}))
+                for key in update.get('$unset', {}):
+                    document.pop(key, None)
+                return
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, FakeCollection(name))
+
+    def command(self, *args, **kwargs):
+        return {'ok': 1}
+
+
+class FakeMongoClient:
+    """Drop-in for pymongo.MongoClient(uri, **options); every client shares one in-memory server"""
+
+    databases = {}
+
+    def __init__(self, *args, **kwargs):
+        self.admin = FakeDatabase()
+
+    def __getitem__(self, name):
+        return self.databases.setdefault(name, FakeDatabase())
+
+    def close(self):
+        pass
+
+    @classmethod
+    def reset(cls):
+        cls.databases = {}
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+PyMon benchmark suite
+Usage: python benchmarks/run.py [--suite all|runner|server|scaling] [--quick]
+                                [--output results.json] [--baseline baseline.json]
+                                [--save-baseline baseline.json] [--tolerance 0.2]
+
+Runs fully offline: the runner uploads to a local stand-in collector and
+the collector runs against an in-memory MongoDB stand-in. Results are
+written as JSON. With --baseline, every metric is compared against a stored
+run and the exit code is 1 when any metric regressed by more than the
+tolerance. The scaling suite runs the collector under gunicorn with an
+increasing number of workers.
+"""
+
+import sys
+import os
+import argparse
+import json
+import platform
+import subprocess
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Print a comparison table, returns the names of regressed metrics"""
+    regressions = []
+    print(f"\n{'Metric':<40} {'Baseline':>12} {'Current':>12} {'Change':>9}")
+    for name, current in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous is None or not previous['value']:
+            print(f"{name:<40} {'-':>12} {current['value']:>12} {'new':>9}")
+            continue
+
+        change = (current['value'] - previous['value']) / abs(previous['value'])
+        worse = -change if current['better'] == 'higher' else change
+        flag = ''
+        if worse > tolerance:
+            regressions.append(name)
+            flag = ' ❌'
+        print(f"{name:<40} {previous['value']:>12} {current['value']:>12} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='benchmarks/run.py', description='PyMon benchmark suite')
+    parser.add_argument('--suite', choices=['all', 'runner', 'server', 'scaling'], default='all')
+    parser.add_argument('--quick', action='store_true', help='fewer sizes and repetitions')
+    parser.add_argument('--output', default='bench_results.json', help='where to write the results')
+    parser.add_argument('--baseline', help='results file to compare against')
+    parser.add_argument('--save-baseline', help='also write the results to this baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative change counted as a regression (default: 0.2 = 20%%)')
+    parser.add_argument('--max-workers', type=int,
+                        help='largest gunicorn worker count for the scaling suite (default: half the cores)')
+    options = parser.parse_args()
+
+    results = {}
+    if options.suite in ('all', 'runner'):
+        print("🏃 Runner benchmarks")
+        import bench_runner
+        results.update(bench_runner.run(options.quick))
+    if options.suite in ('all', 'server'):
+        print("🗄️  Collector benchmarks")
+        import bench_server
+        results.update(bench_server.run(options.quick))
+    if options.suite in ('all', 'scaling'):
+        print("🧮 Multi-worker scaling")
+        import bench_scaling
+        results.update(bench_scaling.run(options.quick, options.max_workers))
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'quick': options.quick
+        },
+        'results': results
+    }
+
+    for path in filter(None, [options.output, options.save_baseline]):
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"\n📝 Results written to {path}")
+
+    if options.baseline:
+        with open(options.baseline, 'r') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, options.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} metric(s) regressed by more than {options.tolerance:.0%}")
+            sys.exit(1)
+        print(f"\n✅ No regressions beyond {options.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Gunicorn settings for the LogVoyager collector
+Usage: gunicorn -c gunicorn.conf.py
+
+Worker/thread model:
+- workers (WEB_CONCURRENCY, default: one per core). Parsing payloads and
+  encoding JSON is CPU-bound and holds the GIL, so throughput scales with
+  processes, not threads.
+- threads (GUNICORN_THREADS, default 4) per gthread worker, so a worker
+  keeps its core busy while some requests wait on MongoDB or stream an
+  export.
+- MongoDB: the master creates the indexes once with a short-lived client
+  in a separate process, then forks the workers. Each worker connects on its
+  first request with a pool of threads + 2 connections (the handler threads,
+  compaction and one spare), so the cluster sees at most
+  workers * (threads + 2) connections per host.
+- The read cache is per worker. /metrics adds up every worker's counters
+  through per-process files in METRICS_DIR, so any worker can answer a scrape.
+"""
+
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+chdir = SERVER_DIR
+wsgi_app = 'server:create_app()'
+
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+# gthread only uses the timeout for worker heartbeats, long /export streams are not cut off
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 5
+
+# Read by server.py in each worker, explicit values win
+os.environ.setdefault('MONGO_MAX_POOL_SIZE', str(threads + 2))
+# Only a directory this config made up is removed as a whole, an explicit one may be shared
+OWN_METRICS_DIR = 'METRICS_DIR' not in os.environ
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), f'logvoyager-metrics-{os.getpid()}'))
+METRICS_FILE = re.compile(r'^\d+-\d+\.json(\.tmp)?$')
+
+
+def clear_metrics_dir():
+    """Drop the worker metric files of a previous master"""
+    metrics_dir = os.environ['METRICS_DIR']
+    if OWN_METRICS_DIR:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        return
+    try:
+        names = os.listdir(metrics_dir)
+    except OSError:
+        return
+    for name in names:
+        if METRICS_FILE.match(name):
+            try:
+                os.unlink(os.path.join(metrics_dir, name))
+            except OSError:
+                pass
+
+
+def on_starting(arbiter):
+    """Reset the metrics directory and create indexes once, before any worker is forked.
+
+    Index creation runs in a child process so the master never imports the
+    app or holds a MongoClient; a failure is logged and the workers start anyway.
+    """
+    clear_metrics_dir()
+    try:
+        os.makedirs(os.environ['METRICS_DIR'], exist_ok=True)
+    except OSError as e:
+        print(f"⚠️  Could not create METRICS_DIR {os.environ['METRICS_DIR']}: {e}")
+    subprocess.run([sys.executable, os.path.join(SERVER_DIR, 'server.py'), '--bootstrap-indexes'],
+                   cwd=SERVER_DIR, check=False)
+
+
+def on_exit(arbiter):
+    clear_metrics_dir()
@@ -202,6 +202,21 @@ url = "$SERVER_URL"
 
 timeout = 15
 
+[agent]
+enabled = true
+batch_size = 50
+flush_interval = 2.0
+pool_size = 4
+
+[output]
+head_lines = 2000
+tail_lines = 2000
+collapse_repeats = true
+rate_limit = 0
+rate_burst = 500
+max_line_bytes = 16384
+max_bytes = 4194304
+
 [monitoring]
 capture_stdout = true
 capture_stderr = true
@@ -0,0 +1,177 @@
+"""
+PyMon output policies - keep the uploaded payload bounded
+
+The terminal tee always shows every line. What is kept for the payload goes
+through, in order: a per-line length cap, per-level sampling, collapsing of
+repeated lines, a per-stream rate limit and head/tail retention bounded by
+line count and by size. Everything dropped is counted so the run records
+what was left out.
+"""
+
+import re
+import time
+from collections import deque
+
+LEVEL_PATTERN = re.compile(r'\b(TRACE|DEBUG|INFO|WARNING|WARN|ERROR|CRITICAL|FATAL)\b')
+
+DEFAULT_POLICY = {
+    'output_head_lines': 2000,
+    'output_tail_lines': 2000,
+    'output_collapse_repeats': True,
+    'output_rate_limit': 0,
+    'output_rate_burst': 500,
+    'output_sample': {},
+    'output_max_line_bytes': 16 * 1024,
+    'output_max_bytes': 4 * 1024 * 1024
+}
+
+
+class StreamPolicy:
+    """Filter one stream's lines into a bounded head + tail, counting everything dropped"""
+
+    def __init__(self, head_lines=2000, tail_lines=2000, collapse_repeats=True,
+                 rate_limit=0, rate_burst=500, sample=None, max_line_bytes=16 * 1024, max_bytes=4 * 1024 * 1024):
+        self.head_lines = max(0, head_lines)
+        self.tail_lines = max(0, tail_lines)
+        # Sizes are in characters, like total_bytes; 0 disables a bound
+        self.max_line_bytes = max(0, max_line_bytes)
+        # Head and tail get half of the stream's budget each
+        self.half_budget = max(0, max_bytes) // 2
+        self.collapse_repeats = collapse_repeats
+        self.rate_limit = rate_limit
+        self.rate_burst = max(1, rate_burst)
+        # Keep one line in N for each log level, e.g. {'DEBUG': 10}
+        self.sample = {level.upper(): every for level, every in (sample or {}).items() if every > 1}
+
+        self.head = []
+        self.head_bytes = 0
+        self.head_closed = False
+        self.tail = deque()
+        self.tail_bytes = 0
+        self.last_line = None
+        self.repeats = 0
+        self.level_seen = {}
+        self.tokens = float(self.rate_burst)
+        self.refilled_at = time.monotonic()
+
+        self.counters = {
+            'total_lines': 0,
+            'total_bytes': 0,
+            'kept_lines': 0,
+            'sampled': 0,
+            'repeated': 0,
+            'rate_limited': 0,
+            'truncated': 0,
+            'truncated_bytes': 0
+        }
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a policy from the output_* keys of load_config()"""
+        settings = dict(DEFAULT_POLICY)
+        settings.update({key: value for key, value in (config or {}).items() if key in DEFAULT_POLICY})
+        return cls(
+            head_lines=settings['output_head_lines'],
+            tail_lines=settings['output_tail_lines'],
+            collapse_repeats=settings['output_collapse_repeats'],
+            rate_limit=settings['output_rate_limit'],
+            rate_burst=settings['output_rate_burst'],
+            sample=settings['output_sample'],
+            max_line_bytes=settings['output_max_line_bytes'],
+            max_bytes=settings['output_max_bytes']
+        )
+
+    def add_text(self, text):
+        """Feed a chunk that may hold several lines"""
+        for line in text.splitlines(keepends=True):
+            self.add(line)
+
+    def add(self, line, cut=0):
+        """Feed one line of output, `cut` of its characters already dropped by the reader"""
+        self.counters['total_lines'] += 1
+        self.counters['total_bytes'] += len(line) + cut
+
+        if cut or (self.max_line_bytes and len(line) > self.max_line_bytes):
+            kept = line[:self.max_line_bytes] if self.max_line_bytes else line
+            cut += len(line) - len(kept)
+            self.counters['truncated_bytes'] += cut
+            if kept.endswith('\n'):
+                kept = kept[:-1]
+            line = f"{kept} [pymon] ... {cut} characters cut\n"
+
+        if self.sample:
+            match = LEVEL_PATTERN.search(line)
+            if match:
+                level = 'WARNING' if match.group(1) == 'WARN' else match.group(1)
+                every = self.sample.get(level)
+                if every:
+                    seen = self.level_seen.get(level, 0)
+                    self.level_seen[level] = seen + 1
+                    if seen % every:
+                        self.counters['sampled'] += 1
+                        return
+
+        # Only repeats of a kept line collapse, repeats of a rate limited one are rate limited too
+        if self.collapse_repeats and line == self.last_line:
+            self.repeats += 1
+            self.counters['repeated'] += 1
+            return
+
+        if self.rate_limit > 0:
+            now = time.monotonic()
+            self.tokens = min(self.rate_burst, self.tokens + (now - self.refilled_at) * self.rate_limit)
+            self.refilled_at = now
+            if self.tokens < 1:
+                self.counters['rate_limited'] += 1
+                return
+            self.tokens -= 1
+
+        if self.collapse_repeats:
+            self._flush_repeats()
+            self.last_line = line
+        self._keep(line)
+
+    def text(self):
+        """Retained output: head, an omission marker if anything was cut, then tail"""
+        self._flush_repeats()
+        output = ''.join(self.head)
+        if self.counters['truncated']:
+            output += f"[pymon] ... {self.counters['truncated']} lines omitted ...\n"
+        return output + ''.join(self.tail)
+
+    def _flush_repeats(self):
+        if self.repeats:
+            self._keep(f"[pymon] previous line repeated ×{self.repeats}\n")
+            self.repeats = 0
+
+    def _keep(self, line):
+        if not line.endswith('\n'):
+            line += '\n'
+        size = len(line)
+
+        # Once a line misses the head, later ones go to the tail so the order is kept
+        if not self.head_closed:
+            if len(self.head) < self.head_lines and (not self.half_budget or self.head_bytes + size <= self.half_budget):
+                self.head.append(line)
+                self.head_bytes += size
+                self.counters['kept_lines'] = len(self.head) + len(self.tail)
+                return
+            self.head_closed = True
+
+        self.tail.append(line)
+        self.tail_bytes += size
+        while self.tail and (len(self.tail) > self.tail_lines or
+                             (self.half_budget and self.tail_bytes > self.half_budget)):
+            self.tail_bytes -= len(self.tail.popleft())
+            self.counters['truncated'] += 1
+        self.counters['kept_lines'] = len(self.head) + len(self.tail)
+
+
+def format_output_stats(policies):
+    """Lines for the payload's OUTPUT POLICY section, `stdout_sampled: 12` style"""
+    lines = []
+    for stream, policy in policies.items():
+        policy._flush_repeats()
+        for key, value in policy.counters.items():
+            lines.append(f"{stream}_{key}: {value}\n")
+    return ''.join(lines)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+PyMon Profiler - Profile a script while it runs under the monitor
+Usage: python profiler.py --out <file> [--mode sample|cprofile] [--interval S] <script.py> [args...]
+
+The default `sample` mode uses a background thread that snapshots every
+thread's stack at a fixed interval, which keeps overhead low. `cprofile`
+mode uses the deterministic profiler instead and is used automatically
+on interpreters without sys._current_frames(). Both write aggregated
+stacks in collapsed (flamegraph) format to a JSON file the runner attaches
+to the run.
+"""
+
+import sys
+import os
+import argparse
+import json
+import re
+import runpy
+import threading
+import time
+
+# Frames from the profiler and runpy wrap the script and are not part of its profile
+INFRASTRUCTURE_FILES = {__file__, os.path.abspath(__file__), runpy.__file__, '<frozen runpy>'}
+
+
+def frame_label(code):
+    """One collapsed-stack frame, `function (file.py:line)`"""
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Count every thread's call stack at a fixed interval from a background thread"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.counts = {}
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='pymon-profiler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    if frame.f_code.co_filename in INFRASTRUCTURE_FILES:
+                        # Everything from here to the root belongs to the wrapper
+                        break
+                    stack.append(frame_label(frame.f_code))
+                    frame = frame.f_back
+                if stack:
+                    key = ';'.join(reversed(stack))
+                    self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    def result(self):
+        return {
+            'profiler': 'sampling',
+            'unit': 'samples',
+            'interval': self.interval,
+            'samples': self.samples,
+            'stacks': '\n'.join(f"{stack} {count}" for stack, count in sorted(self.counts.items()))
+        }
+
+
+def cprofile_result(profile):
+    """Convert cProfile stats into collapsed `caller;callee` pairs weighted by self time in microseconds
+
+    The pairs are only two frames deep, so inclusive time cannot be rebuilt
+    from them. It is sent separately as cProfile's own cumulative time.
+    """
+    import pstats
+
+    def label(func):
+        filename, line, name = func
+        if filename == '~':
+            # Built-ins, drop the object address so labels match across runs
+            return re.sub(r' at 0x[0-9a-f]+', '', name)
+        return f"{name} ({os.path.basename(filename)}:{line})"
+
+    counts = {}
+    cumulative = {}
+    total_calls = 0
+    for func, (cc, nc, tt, ct, callers) in pstats.Stats(profile).stats.items():
+        if func[0] in INFRASTRUCTURE_FILES:
+            continue
+        total_calls += nc
+        # ct already counts recursive calls once
+        cumulative[label(func)] = cumulative.get(label(func), 0) + int(ct * 1_000_000)
+        if not callers:
+            weight = int(tt * 1_000_000)
+            if weight:
+                counts[label(func)] = counts.get(label(func), 0) + weight
+            continue
+        for caller, caller_stats in callers.items():
+            # Per-caller stats are (nc, cc, tt, ct); tt is the self time spent when called from there
+            weight = int(caller_stats[2] * 1_000_000)
+            if not weight:
+                continue
+            if caller[0] in INFRASTRUCTURE_FILES:
+                key = label(func)
+            else:
+                key = f"{label(caller)};{label(func)}"
+            counts[key] = counts.get(key, 0) + weight
+
+    return {
+        'profiler': 'cprofile',
+        'unit': 'microseconds',
+        'interval': None,
+        'samples': total_calls,
+        'stacks': '\n'.join(f"{stack} {count}" for stack, count in sorted(counts.items())),
+        'cumulative': cumulative
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='profiler.py', description='Profile a Python script')
+    parser.add_argument('--out', required=True, help='JSON file to write the profile to')
+    parser.add_argument('--mode', choices=['sample', 'cprofile'], default='sample')
+    parser.add_argument('--interval', type=float, default=0.005, help='sampling interval in seconds')
+    parser.add_argument('script')
+    parser.add_argument('args', nargs=argparse.REMAINDER)
+    options = parser.parse_args()
+
+    mode = options.mode
+    if mode == 'sample' and not hasattr(sys, '_current_frames'):
+        mode = 'cprofile'
+
+    # Make the script see the same argv and import path as a plain `python script.py`
+    sys.argv = [options.script] + options.args
+    sys.path[0] = os.path.dirname(os.path.abspath(options.script))
+
+    started = time.perf_counter()
+    if mode == 'sample':
+        sampler = StackSampler(options.interval)
+        sampler.start()
+    else:
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+
+    try:
+        runpy.run_path(options.script, run_name='__main__')
+    finally:
+        if mode == 'sample':
+            sampler.stop()
+            result = sampler.result()
+        else:
+            profile.disable()
+            result = cprofile_result(profile)
+        result['duration'] = round(time.perf_counter() - started, 6)
+
+        with open(options.out, 'w') as f:
+            json.dump(result, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,17 +10,53 @@ import time
 import platform
 import subprocess
 import select
+import socket
+import stat
+import tempfile
 import threading
 
+from output_policy import StreamPolicy, format_output_stats
+
 # Get the directory of this script
 SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+PROFILER_PATH = os.path.join(SCRIPT_DIR, 'profiler.py')
+RUNNER_PATH = os.path.join(SCRIPT_DIR, 'runner.py')
+
+def default_agent_socket():
+    """Unix socket path the pymon agent listens on, in a directory private to this user"""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    socket_dir = os.path.join(runtime_dir, 'pymon') if runtime_dir else os.path.expanduser('~/.pymon')
+    return os.path.join(socket_dir, 'agent.sock')
+
+def is_own_socket(path):
+    """True when path is a Unix socket owned by the current user, so run output never goes to someone else"""
+    if not hasattr(os, 'getuid'):
+        return False
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(info.st_mode) and info.st_uid == os.getuid()
 
 # Load configuration
 def load_config():
     """Load configuration from pymon.config.toml or environment variables"""
     config = {
         'server_url': os.environ.get('PYMON_SERVER_URL', 'https://logv.onrender.com/post'),
-        'timeout': int(os.environ.get('PYMON_TIMEOUT', '15'))
+        'timeout': int(os.environ.get('PYMON_TIMEOUT', '15')),
+        'agent_enabled': True,
+        'agent_socket': default_agent_socket(),
+        'agent_batch_size': 50,
+        'agent_flush_interval': 2.0,
+        'agent_pool_size': 4,
+        'output_head_lines': 2000,
+        'output_tail_lines': 2000,
+        'output_collapse_repeats': True,
+        'output_rate_limit': 0,
+        'output_rate_burst': 500,
+        'output_sample': {},
+        'output_max_line_bytes': 16 * 1024,
+        'output_max_bytes': 4 * 1024 * 1024
     }
     
     # Try to load from config file in the same directory as this script
@@ -31,6 +67,7 @@ def load_config():
                 content = f.read()
                 
                 # Simple TOML parser for our specific config
+                section = ''
                 for line in content.split('\n'):
                     line = line.strip()
                     
@@ -38,13 +75,53 @@ def load_config():
                     if not line or line.startswith('#'):
                         continue
                     
+                    # Track the current [section]
+                    if line.startswith('['):
+                        section = line.strip('[]').strip()
+                        continue
+                    
                     # Parse key = value lines
-                    if '=' in line and not line.startswith('['):
+                    if '=' in line:
                         key, value = line.split('=', 1)
                         key = key.strip()
                         value = value.strip().strip('"').strip("'")
                         
-                        if key == 'url':
+                        if section == 'agent':
+                            try:
+                                if key == 'enabled':
+                                    config['agent_enabled'] = value.lower() == 'true'
+                                elif key == 'socket':
+                                    config['agent_socket'] = os.path.expanduser(value)
+                                elif key == 'batch_size':
+                                    config['agent_batch_size'] = int(value)
+                                elif key == 'flush_interval':
+                                    config['agent_flush_interval'] = float(value)
+                                elif key == 'pool_size':
+                                    config['agent_pool_size'] = int(value)
+                            except ValueError:
+                                pass
+                        elif section == 'output':
+                            try:
+                                if key == 'head_lines':
+                                    config['output_head_lines'] = int(value)
+                                elif key == 'tail_lines':
+                                    config['output_tail_lines'] = int(value)
+                                elif key == 'collapse_repeats':
+                                    config['output_collapse_repeats'] = value.lower() == 'true'
+                                elif key == 'rate_limit':
+                                    config['output_rate_limit'] = float(value)
+                                elif key == 'rate_burst':
+                                    config['output_rate_burst'] = int(value)
+                                elif key == 'max_line_bytes':
+                                    config['output_max_line_bytes'] = int(value)
+                                elif key == 'max_bytes':
+                                    config['output_max_bytes'] = int(value)
+                                elif key.startswith('sample_'):
+                                    # sample_debug = 10 keeps one DEBUG line in ten
+                                    config['output_sample'][key[len('sample_'):].upper()] = int(value)
+                            except ValueError:
+                                pass
+                        elif key == 'url':
                             config['server_url'] = value
                         elif key == 'timeout':
                             try:
@@ -62,6 +139,22 @@ def load_config():
         print(f"⚠️  Config file not found: {config_file}")
         print(f"   Using default: {config['server_url']}")
     
+    # Explicit environment variables win over the config file
+    if 'PYMON_SERVER_URL' in os.environ:
+        config['server_url'] = os.environ['PYMON_SERVER_URL']
+        print(f"   Server URL: {config['server_url']} (from PYMON_SERVER_URL)")
+    if 'PYMON_TIMEOUT' in os.environ:
+        try:
+            config['timeout'] = int(os.environ['PYMON_TIMEOUT'])
+        except ValueError:
+            pass
+    
+    # Environment overrides for the agent
+    if 'PYMON_AGENT_SOCKET' in os.environ:
+        config['agent_socket'] = os.environ['PYMON_AGENT_SOCKET']
+    if os.environ.get('PYMON_NO_AGENT'):
+        config['agent_enabled'] = False
+    
     return config
 
 def get_system_metrics():
@@ -104,11 +197,123 @@ def get_system_metrics():
     return metrics
 
 
-def capture_command_output():
+def build_run_report(command_executed, cwd, hostname, start_time, end_time, return_code,
+                     metrics_before, metrics_after, stdout_text, stderr_text, output_stats=None):
+    """Build the structured text report the collector parses for one finished run"""
+    runtime = end_time - start_time
+    
+    # Calculate differences in metrics
+    metrics_diff = {}
+    for key in metrics_before:
+        if isinstance(metrics_before[key], (int, float)):
+            metrics_diff[f"{key}_diff"] = metrics_after[key] - metrics_before[key]
+    
+    # Get directory listing
+    dir_listing = os.listdir(cwd)
+    
+    # Build the structured output for sending to server
+    all_output = f"Start time: {start_time.strftime('%B %d, %Y %I:%M:%S %p')}\n"
+    all_output += f"Runtime: {runtime}\n"
+    all_output += f"Tracked hours: {runtime}\n"
+    all_output += f"Run path: {cwd}\n"
+    all_output += f"Hostname: {hostname}\n"
+    all_output += f"OS: {platform.platform()}\n"
+    all_output += f"Python version: {platform.python_implementation()} {platform.python_version()}\n"
+    all_output += f"Python executable: {sys.executable}\n"
+    all_output += f"Command: {command_executed}\n"
+    all_output += f"System Hardware:\n"
+    all_output += f"  CPU count: {psutil.cpu_count()}\n"
+    all_output += f"  Logical CPU count: {psutil.cpu_count(logical=True)}\n"
+    all_output += f"Directory Listing ({len(dir_listing)} items):\n"
+    for item in sorted(dir_listing):
+        item_path = os.path.join(cwd, item)
+        if os.path.isdir(item_path):
+            all_output += f"  [DIR]  {item}\n"
+        else:
+            size = os.path.getsize(item_path)
+            all_output += f"  [FILE] {item} ({size} bytes)\n"
+    all_output += f"Return code: {return_code}\n"
+    all_output += "\n--- SYSTEM METRICS BEFORE EXECUTION ---\n"
+    for key, value in metrics_before.items():
+        all_output += f"{key}: {value}\n"
+    all_output += "\n--- SYSTEM METRICS AFTER EXECUTION ---\n"
+    for key, value in metrics_after.items():
+        all_output += f"{key}: {value}\n"
+    all_output += "\n--- SYSTEM METRICS DIFFERENCE ---\n"
+    for key, value in metrics_diff.items():
+        all_output += f"{key}: {value}\n"
+    
+    # Capture raw logs
+    all_output += "\n--- STDOUT ---\n"
+    all_output += stdout_text
+    all_output += "--- STDERR ---\n"
+    all_output += stderr_text
+    
+    # Also capture structured logs with timestamps if present
+    all_output += "\n--- STRUCTURED LOGS ---\n"
+    
+    # Combine stdout and stderr for log parsing
+    combined_logs = stdout_text + stderr_text
+    
+    # Parse logs with timestamps
+    import re
+    log_lines = combined_logs.split('\n')
+    structured_logs = []
+    
+    i = 0
+    while i < len(log_lines):
+        line = log_lines[i].strip()
+        # Look for timestamp patterns like YYYY-MM-DD HH:MM:SS
+        timestamp_match = re.search(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})', line)
+        if timestamp_match:
+            timestamp = timestamp_match.group(1)
+            
+            # The actual log message might be on the next line
+            log_message = line[timestamp_match.end():].strip()
+            
+            # If the current line after timestamp is empty, look at the next line
+            if not log_message and i + 1 < len(log_lines):
+                next_line = log_lines[i + 1].strip()
+                # If the next line doesn't look like a timestamp, treat it as the message
+                if not re.search(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})', next_line):
+                    log_message = next_line
+                    i += 1  # Skip the next line since we used it
+            
+            if log_message.startswith('|'):
+                log_message = log_message[1:].strip()
+            structured_logs.append({
+                'timestamp': timestamp,
+                'message': log_message
+            })
+        i += 1
+    
+    if structured_logs:
+        for log_entry in structured_logs:
+            all_output += f"{log_entry['timestamp']} {log_entry['message']}\n"
+    else:
+        all_output += "No timestamped logs found in output.\n"
+    
+    # What the output policies left out of the logs above
+    if output_stats:
+        all_output += "\n--- OUTPUT POLICY ---\n"
+        all_output += output_stats
+    all_output += f"\n--- EXECUTION TIME ---\n{end_time.isoformat()}\n"
+    
+    return all_output
+
+def format_command(args):
+    """Command recorded for a run: the runner path, then the script and its arguments.
+
+    Single and batch runs of the same script record the same string, so
+    they group together on the collector.
+    """
+    return ' '.join([RUNNER_PATH] + list(args))
+
+def capture_command_output(child_args=None, config=None):
     """Capture the output of a command in REAL-TIME while collecting data"""
     
     # Get the current command that was executed
-    command_executed = ' '.join(sys.argv)
+    command_executed = format_command(sys.argv[1:])
     
     # Get current working directory
     cwd = os.getcwd()
@@ -125,17 +330,18 @@ def capture_command_output():
     # Gather system metrics before execution
     metrics_before = get_system_metrics()
     
-    # Prepare the command to run (the original Python script)
-    script_to_run = sys.argv[1] if len(sys.argv) > 1 else 'minimal_py_code.py'
+    # Prepare the command to run (the original Python script and its arguments)
+    if child_args is None:
+        child_args = sys.argv[1:] if len(sys.argv) > 1 else ['minimal_py_code.py']
     
-    # Buffers to capture output
-    stdout_lines = []
-    stderr_lines = []
+    # Bounded buffers for the payload, the terminal still sees every line
+    stdout_policy = StreamPolicy.from_config(config)
+    stderr_policy = StreamPolicy.from_config(config)
     
     try:
         # Run the command with REAL-TIME output streaming
         process = subprocess.Popen(
-            [sys.executable, script_to_run],
+            [sys.executable] + child_args,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
@@ -151,13 +357,13 @@ def capture_command_output():
                 for line in iter(process.stdout.readline, ''):
                     if line:
                         print(line, end='', flush=True)  # Print in real-time
-                        stdout_lines.append(line)
+                        stdout_policy.add(line)
             
             def read_stderr():
                 for line in iter(process.stderr.readline, ''):
                     if line:
                         print(line, end='', file=sys.stderr, flush=True)  # Print in real-time
-                        stderr_lines.append(line)
+                        stderr_policy.add(line)
             
             stdout_thread = threading.Thread(target=read_stdout)
             stderr_thread = threading.Thread(target=read_stderr)
@@ -183,10 +389,10 @@ def capture_command_output():
                     
                     if remaining_stdout:
                         print(remaining_stdout, end='', flush=True)
-                        stdout_lines.append(remaining_stdout)
+                        stdout_policy.add_text(remaining_stdout)
                     if remaining_stderr:
                         print(remaining_stderr, end='', file=sys.stderr, flush=True)
-                        stderr_lines.append(remaining_stderr)
+                        stderr_policy.add_text(remaining_stderr)
                     break
                 
                 # Read available output
@@ -197,115 +403,27 @@ def capture_command_output():
                     if line:
                         if stream == process.stdout:
                             print(line, end='', flush=True)  # Print in real-time
-                            stdout_lines.append(line)
+                            stdout_policy.add(line)
                         else:
                             print(line, end='', file=sys.stderr, flush=True)  # Print in real-time
-                            stderr_lines.append(line)
+                            stderr_policy.add(line)
         
         return_code = process.returncode
         
         # Calculate runtime
         end_time = datetime.now()
-        runtime = end_time - start_time
         
         # Gather system metrics after execution
         metrics_after = get_system_metrics()
         
-        # Calculate differences in metrics
-        metrics_diff = {}
-        for key in metrics_before:
-            if isinstance(metrics_before[key], (int, float)):
-                metrics_diff[f"{key}_diff"] = metrics_after[key] - metrics_before[key]
-        
-        # Get directory listing
-        dir_listing = os.listdir(cwd)
-        
         # Join captured output
-        stdout_text = ''.join(stdout_lines)
-        stderr_text = ''.join(stderr_lines)
+        stdout_text = stdout_policy.text()
+        stderr_text = stderr_policy.text()
+        output_stats = format_output_stats({'stdout': stdout_policy, 'stderr': stderr_policy})
         
         # Build the structured output for sending to server
-        all_output = f"Start time: {start_time.strftime('%B %d, %Y %I:%M:%S %p')}\n"
-        all_output += f"Runtime: {runtime}\n"
-        all_output += f"Tracked hours: {runtime}\n"
-        all_output += f"Run path: {cwd}\n"
-        all_output += f"Hostname: {hostname}\n"
-        all_output += f"OS: {platform.platform()}\n"
-        all_output += f"Python version: {platform.python_implementation()} {platform.python_version()}\n"
-        all_output += f"Python executable: {sys_module.executable}\n"
-        all_output += f"Command: {command_executed}\n"
-        all_output += f"System Hardware:\n"
-        all_output += f"  CPU count: {psutil.cpu_count()}\n"
-        all_output += f"  Logical CPU count: {psutil.cpu_count(logical=True)}\n"
-        all_output += f"Directory Listing ({len(dir_listing)} items):\n"
-        for item in sorted(dir_listing):
-            item_path = os.path.join(cwd, item)
-            if os.path.isdir(item_path):
-                all_output += f"  [DIR]  {item}\n"
-            else:
-                size = os.path.getsize(item_path)
-                all_output += f"  [FILE] {item} ({size} bytes)\n"
-        all_output += f"Return code: {return_code}\n"
-        all_output += "\n--- SYSTEM METRICS BEFORE EXECUTION ---\n"
-        for key, value in metrics_before.items():
-            all_output += f"{key}: {value}\n"
-        all_output += "\n--- SYSTEM METRICS AFTER EXECUTION ---\n"
-        for key, value in metrics_after.items():
-            all_output += f"{key}: {value}\n"
-        all_output += "\n--- SYSTEM METRICS DIFFERENCE ---\n"
-        for key, value in metrics_diff.items():
-            all_output += f"{key}: {value}\n"
-        
-        # Capture raw logs
-        all_output += "\n--- STDOUT ---\n"
-        all_output += stdout_text
-        all_output += "--- STDERR ---\n"
-        all_output += stderr_text
-        
-        # Also capture structured logs with timestamps if present
-        all_output += "\n--- STRUCTURED LOGS ---\n"
-        
-        # Combine stdout and stderr for log parsing
-        combined_logs = stdout_text + stderr_text
-        
-        # Parse logs with timestamps
-        import re
-        log_lines = combined_logs.split('\n')
-        structured_logs = []
-        
-        i = 0
-        while i < len(log_lines):
-            line = log_lines[i].strip()
-            # Look for timestamp patterns like YYYY-MM-DD HH:MM:SS
-            timestamp_match = re.search(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})', line)
-            if timestamp_match:
-                timestamp = timestamp_match.group(1)
-                
-                # The actual log message might be on the next line
-                log_message = line[timestamp_match.end():].strip()
-                
-                # If the current line after timestamp is empty, look at the next line
-                if not log_message and i + 1 < len(log_lines):
-                    next_line = log_lines[i + 1].strip()
-                    # If the next line doesn't look like a timestamp, treat it as the message
-                    if not re.search(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})', next_line):
-                        log_message = next_line
-                        i += 1  # Skip the next line since we used it
-                
-                if log_message.startswith('|'):
-                    log_message = log_message[1:].strip()
-                structured_logs.append({
-                    'timestamp': timestamp,
-                    'message': log_message
-                })
-            i += 1
-        
-        if structured_logs:
-            for log_entry in structured_logs:
-                all_output += f"{log_entry['timestamp']} {log_entry['message']}\n"
-        else:
-            all_output += "No timestamped logs found in output.\n"
-        all_output += f"\n--- EXECUTION TIME ---\n{end_time.isoformat()}\n"
+        all_output = build_run_report(command_executed, cwd, hostname, start_time, end_time, return_code,
+                                      metrics_before, metrics_after, stdout_text, stderr_text, output_stats)
         
         return all_output, return_code
         
@@ -326,8 +444,8 @@ def capture_command_output():
         # Get directory listing
         dir_listing = os.listdir(cwd)
         
-        stdout_text = ''.join(stdout_lines)
-        stderr_text = ''.join(stderr_lines)
+        stdout_text = stdout_policy.text()
+        stderr_text = stderr_policy.text()
         
         error_output = f"Start time: {start_time.strftime('%B %d, %Y %I:%M:%S %p')}\n"
         error_output += f"Runtime: {runtime}\n"
@@ -371,26 +489,79 @@ def capture_command_output():
 
         return error_output, -1
 
-def send_to_external_service(data, service_url=None):
-    """Send captured data to an external service"""
+def build_payload(data, profile=None):
+    """Wrap captured run data in the JSON envelope the collector expects"""
+    payload = {
+        'timestamp': datetime.now().isoformat(),
+        'data': data,
+        'source': f"{os.uname().nodename if hasattr(os, 'uname') else 'unknown'}:{os.getcwd()}",
+        'type': 'cli_execution_log'
+    }
+    if profile:
+        payload['profile'] = profile
+    return payload
+
+def load_profile(profile_path):
+    """Read the profile the profiler wrapper wrote, None if the child never got that far"""
+    try:
+        with open(profile_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+    finally:
+        if os.path.exists(profile_path):
+            os.unlink(profile_path)
+
+def send_to_agent(payload, config):
+    """Hand a payload to the local pymon agent, returns its reply or None when no agent is running"""
+    socket_path = config['agent_socket']
+    if not config['agent_enabled'] or not hasattr(socket, 'AF_UNIX') or not is_own_socket(socket_path):
+        return None
     
-    config = load_config()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(config['timeout'])
+            sock.connect(socket_path)
+            message = json.dumps({'type': 'payload', 'payload': payload}) + '\n'
+            sock.sendall(message.encode('utf-8'))
+            reply = sock.makefile('rb').readline()
+        
+        if not reply:
+            return None
+        reply = json.loads(reply)
+        return reply if reply.get('status') == 'queued' else None
+    except (OSError, ValueError):
+        return None
+
+def send_to_external_service(data, service_url=None, config=None, profile=None):
+    """Send captured data to an external service, through the local agent when one is running"""
+    
+    if config is None:
+        config = load_config()
     if service_url is None:
         service_url = config['server_url']
     
+    payload = build_payload(data, profile)
+    
+    # Prefer the long-lived agent: it keeps a warm connection pool and batches uploads
+    if service_url == config['server_url']:
+        agent_reply = send_to_agent(payload, config)
+        if agent_reply is not None:
+            print(f"\n{'='*60}")
+            print(f"📊 Monitoring Summary")
+            print(f"{'='*60}")
+            print(f"✅ Data queued with pymon agent ({config['agent_socket']})")
+            print(f"   Pending uploads: {agent_reply.get('pending', 0)}")
+            print(f"   View at: {service_url.replace('/post', '/view')}")
+            print(f"{'='*60}\n")
+            return True, None
+    
     try:
         headers = {
             'Content-Type': 'application/json',
             'User-Agent': 'PyMon/1.0'
         }
         
-        payload = {
-            'timestamp': datetime.now().isoformat(),
-            'data': data,
-            'source': f"{os.uname().nodename if hasattr(os, 'uname') else 'unknown'}:{os.getcwd()}",
-            'type': 'cli_execution_log'
-        }
-        
         response = requests.post(service_url, json=payload, headers=headers, timeout=config['timeout'])
         
         print(f"\n{'='*60}")
@@ -422,18 +593,43 @@ def send_to_external_service(data, service_url=None):
         return False, None
 
 def main():
+    # Leading --profile[=sample|cprofile] runs the child under profiler.py
+    profile_mode = None
+    if len(sys.argv) > 1 and sys.argv[1].startswith('--profile'):
+        profile_mode = sys.argv[1].partition('=')[2] or 'sample'
+        if profile_mode not in ('sample', 'cprofile'):
+            print(f"❌ Error: unknown profile mode '{profile_mode}' (use sample or cprofile)")
+            sys.exit(1)
+        # Drop the flag so the recorded command matches unprofiled runs of the same script
+        del sys.argv[1]
+    
     if len(sys.argv) < 2:
-        print("Usage: python runner.py <script_to_run>")
+        print("Usage: python runner.py [--profile[=sample|cprofile]] <script_to_run> [args...]")
         sys.exit(1)
     
     print(f"🔍 PyMon - Monitoring: {sys.argv[1]}")
+    if profile_mode:
+        print(f"🔥 Profiling: {profile_mode}")
     print(f"{'='*60}\n")
     
+    config = load_config()
+    
+    child_args = None
+    profile_path = None
+    if profile_mode:
+        fd, profile_path = tempfile.mkstemp(prefix='pymon-profile-', suffix='.json')
+        os.close(fd)
+        child_args = [PROFILER_PATH, '--mode', profile_mode, '--out', profile_path] + sys.argv[1:]
+    
     # Capture all output from the command (with real-time streaming)
-    captured_data, return_code = capture_command_output()
+    captured_data, return_code = capture_command_output(child_args, config)
+    
+    profile = load_profile(profile_path) if profile_path else None
+    if profile_mode and profile is None:
+        print("⚠️  No profile was written by the profiled script")
     
     # Send the captured data to an external service (AFTER script finishes)
-    success, response = send_to_external_service(captured_data)
+    success, response = send_to_external_service(captured_data, config=config, profile=profile)
     
     # Exit with the original return code
     sys.exit(return_code)
@@ -1,13 +1,26 @@
-from flask import Flask, request, jsonify
-from datetime import datetime
+from flask import Flask, Blueprint, current_app, request, jsonify, stream_with_context, g
+from datetime import datetime, timedelta, timezone
 import uuid
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, OperationFailure
+import json
+import threading
+import time
+import zlib
+import itertools
+import tempfile
+import hashlib
+from bisect import bisect_left
+from collections import OrderedDict
+from pymongo import MongoClient, monitoring
+from pymongo.errors import ConnectionFailure, OperationFailure, DuplicateKeyError, BulkWriteError, PyMongoError
+from bson import ObjectId
+from bson.errors import InvalidId
 import os
+import sys
+import atexit
 import certifi
 import ssl
 
-app = Flask(__name__)
+collector = Blueprint('collector', __name__)
 
 # MongoDB Configuration
 MONGODB_URI = os.environ.get(
@@ -16,16 +29,512 @@ MONGODB_URI = os.environ.get(
 )
 DATABASE_NAME = 'logvoyager'
 COLLECTION_NAME = 'logs'
+PROFILES_COLLECTION_NAME = 'profiles'
 
-# Initialize MongoDB client with multiple fallback strategies
+# Retention tiers, in days since receipt (0 disables a tier)
+#   hot        full documents
+#   compressed log bodies zlib-compressed after RETENTION_HOT_DAYS (lossless)
+#   excerpt    log bodies cut to head/tail excerpts after RETENTION_EXCERPT_DAYS
+#   deleted    removed by a TTL index after RETENTION_DAYS
+RETENTION_HOT_DAYS = float(os.environ.get('RETENTION_HOT_DAYS', '7'))
+RETENTION_EXCERPT_DAYS = float(os.environ.get('RETENTION_EXCERPT_DAYS', '0'))
+RETENTION_DAYS = float(os.environ.get('RETENTION_DAYS', '0'))
+RETENTION_EXCERPT_LINES = int(os.environ.get('RETENTION_EXCERPT_LINES', '50'))
+COMPACTION_INTERVAL = int(os.environ.get('COMPACTION_INTERVAL', '300'))
+COMPACTION_BATCH = int(os.environ.get('COMPACTION_BATCH', '100'))
+
+# Read cache: run documents by size-bounded LRU, list/stats responses by short TTL
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.environ.get('CACHE_TTL_SECONDS', '5'))
+CACHE_VIEW_MAX_BYTES = int(os.environ.get('CACHE_VIEW_MAX_BYTES', str(16 * 1024 * 1024)))
+
+# Largest page /view serves, bounds the response and what a single request can pin in the cache
+VIEW_MAX_LIMIT = int(os.environ.get('VIEW_MAX_LIMIT', '200'))
+
+# Bulk export: documents fetched per cursor round trip and bytes buffered per streamed chunk
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '500'))
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+# Connection pool of each worker process. Size it to the worker's handler threads
+# plus headroom for compaction and streaming exports (gunicorn.conf.py does this)
+MONGO_POOL_OPTIONS = {
+    'maxPoolSize': int(os.environ.get('MONGO_MAX_POOL_SIZE', '10')),
+    'minPoolSize': int(os.environ.get('MONGO_MIN_POOL_SIZE', '0')),
+    'maxIdleTimeMS': int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '300000')),
+    'waitQueueTimeoutMS': int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000'))
+}
+
+# With several worker processes each one writes its metrics here and /metrics adds
+# them up, so whichever worker answers a scrape reports totals (gunicorn.conf.py sets it)
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '1'))
+
+# A worker that could not connect keeps answering 503 and retries with exponential backoff up to this
+MONGO_RETRY_MAX_SECONDS = float(os.environ.get('MONGO_RETRY_MAX_SECONDS', '60'))
+
+# Only the worker holding this lock runs compaction, the others stand by
+COMPACTION_LOCK_FILE = os.environ.get(
+    'COMPACTION_LOCK_FILE',
+    os.path.join(tempfile.gettempdir(), 'logvoyager-compaction.lock')
+)
+
+# MongoDB state of this process, set up lazily by init_mongodb()
 MONGODB_CONNECTED = False
 logs_collection = None
+profiles_collection = None
 client = None
+connection_pid = None
+connecting_pid = None
+connect_failures = 0
+next_connect_attempt = 0.0
+connection_lock = threading.Lock()
 
-def connect_mongodb():
-    """Try multiple connection strategies"""
-    global client, logs_collection, MONGODB_CONNECTED
+class ResponseCache:
+    """Serialized JSON bodies with their ETag and Last-Modified.
+
+    Run documents only change when compaction moves them to a later tier,
+    which happens at a known age, so they are kept in an LRU bounded by total
+    body size and re-read once their age says a rewrite is due (see
+    cached_run_is_current). List and stats responses expire after a short
+    TTL, within their own byte budget, and are dropped on every ingest.
+    """
+    
+    def __init__(self, max_bytes, ttl, view_max_bytes):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.view_max_bytes = view_max_bytes
+        self.runs = OrderedDict()
+        self.run_bytes = 0
+        # Insertion order is expiry order, the TTL being the same for every entry
+        self.views = OrderedDict()
+        self.view_bytes = 0
+        self.generation = 0
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def make_entry(data, last_modified):
+        body = current_app.json.dumps(data).encode('utf-8')
+        return {
+            'body': body,
+            'etag': hashlib.blake2b(body, digest_size=16).hexdigest(),
+            'last_modified': last_modified
+        }
+    
+    def get_run(self, run_id):
+        with self.lock:
+            entry = self.runs.get(run_id)
+            if entry is not None:
+                self.runs.move_to_end(run_id)
+            return entry
+    
+    def put_run(self, run_id, entry):
+        size = len(entry['body'])
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.runs.pop(run_id, None)
+            if previous is not None:
+                self.run_bytes -= len(previous['body'])
+            self.runs[run_id] = entry
+            self.run_bytes += size
+            while self.run_bytes > self.max_bytes:
+                _, evicted = self.runs.popitem(last=False)
+                self.run_bytes -= len(evicted['body'])
+    
+    def evict_run(self, run_id):
+        with self.lock:
+            entry = self.runs.pop(run_id, None)
+            if entry is not None:
+                self.run_bytes -= len(entry['body'])
+    
+    def get_view(self, key):
+        with self.lock:
+            entry = self.views.get(key)
+            if entry is None or entry['generation'] != self.generation or entry['expires'] < time.monotonic():
+                return None
+            return entry
+    
+    def put_view(self, key, entry, generation):
+        """Store a list/stats entry computed while `generation` was current"""
+        size = len(entry['body'])
+        if self.ttl <= 0 or size > self.view_max_bytes:
+            return
+        with self.lock:
+            if generation != self.generation:
+                # An ingest happened while this response was being built
+                return
+            now = time.monotonic()
+            previous = self.views.pop(key, None)
+            if previous is not None:
+                self.view_bytes -= len(previous['body'])
+            
+            # Drop expired entries first, then the oldest ones until the new entry fits
+            while self.views:
+                oldest_key, oldest = next(iter(self.views.items()))
+                if oldest['expires'] >= now and self.view_bytes + size <= self.view_max_bytes:
+                    break
+                del self.views[oldest_key]
+                self.view_bytes -= len(oldest['body'])
+            
+            entry['generation'] = generation
+            entry['expires'] = now + self.ttl
+            self.views[key] = entry
+            self.view_bytes += size
+    
+    def invalidate_views(self):
+        """Called on ingest: every list and stats response may have changed"""
+        with self.lock:
+            self.generation += 1
+            self.views.clear()
+            self.view_bytes = 0
+
+response_cache = ResponseCache(CACHE_MAX_BYTES, CACHE_TTL_SECONDS, CACHE_VIEW_MAX_BYTES)
+
+# Retention tiers in the order compaction moves runs through them
+TIER_ORDER = {'hot': 0, 'compressed': 1, 'excerpt': 2, 'deleted': 3}
+
+# While compaction lags behind a due rewrite, re-read the run at most this often
+STALE_RUN_RECHECK_SECONDS = 30
+
+def tier_due(received_at, now):
+    """Tier a run of this age belongs in once compaction and TTL expiry have caught up"""
+    age_days = (now - received_at.replace(tzinfo=timezone.utc)).total_seconds() / 86400
+    if RETENTION_DAYS > 0 and age_days >= RETENTION_DAYS:
+        return 'deleted'
+    if RETENTION_EXCERPT_DAYS > 0 and age_days >= RETENTION_EXCERPT_DAYS:
+        return 'excerpt'
+    if RETENTION_HOT_DAYS > 0 and age_days >= RETENTION_HOT_DAYS:
+        return 'compressed'
+    return 'hot'
+
+def cached_run_is_current(entry):
+    """False when the run may have been rewritten or deleted since it was cached.
+
+    Compaction runs in one worker only, so other workers learn about a
+    rewrite from the run's age rather than from an eviction.
+    """
+    if entry.get('recheck_at', 0) > time.monotonic():
+        return True
+    due = tier_due(entry['received_at'], datetime.now(timezone.utc))
+    return TIER_ORDER[due] <= TIER_ORDER.get(entry.get('tier'), 0)
+
+def cached_json_response(entry):
+    """JSON response for a cache entry, a 304 when the client's copy is still current"""
+    response = current_app.response_class(entry['body'], mimetype='application/json')
+    response.set_etag(entry['etag'])
+    if entry['last_modified'] is not None:
+        response.last_modified = entry['last_modified']
+    # Clients may keep the body but must revalidate, which is cheap
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response.make_conditional(request)
+
+# Self-instrumentation, exposed in the Prometheus text format at /metrics
+class Counter:
+    """Monotonic counter per label set"""
+    
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+    
+    def inc(self, label_values=(), amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+    
+    def snapshot(self):
+        with self.lock:
+            return [[list(label_values), value] for label_values, value in self.values.items()]
+    
+    def render(self, snapshots):
+        merged = {}
+        for snapshot in snapshots:
+            for label_values, value in snapshot:
+                merged[tuple(label_values)] = merged.get(tuple(label_values), 0) + value
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(merged.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, label_values)} {value}")
+        return lines
+
+class Gauge:
+    """Value that goes up and down, or is read from a callback at scrape time"""
+    
+    def __init__(self, name, help_text, callback=None):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+        self.value = 0
+        self.lock = threading.Lock()
+    
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+    
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+    
+    def set(self, value):
+        with self.lock:
+            self.value = value
+    
+    def snapshot(self):
+        return self.callback() if self.callback else self.value
+    
+    def render(self, snapshots):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {sum(snapshots)}"]
+
+class Histogram:
+    """Fixed-bucket histogram per label set; observe() is a bisect and a few additions"""
+    
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = sorted(buckets)
+        self.labels = labels
+        self.series = {}
+        self.lock = threading.Lock()
+    
+    def observe(self, label_values, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            series['counts'][index] += 1
+            series['sum'] += value
+    
+    def snapshot(self):
+        with self.lock:
+            return [[list(label_values), list(series['counts']), series['sum']]
+                    for label_values, series in self.series.items()]
+    
+    def render(self, snapshots):
+        merged = {}
+        for snapshot in snapshots:
+            for label_values, counts, total in snapshot:
+                series = merged.setdefault(tuple(label_values), {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0})
+                series['counts'] = [a + b for a, b in zip(series['counts'], counts)]
+                series['sum'] += total
+        
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + [float('inf')], series['counts']):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                labels = format_labels(self.labels + ('le',), label_values + (le,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {series['sum']}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+def escape_label_value(value):
+    """Backslash, double quote and newline escaped as the text exposition format requires"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+# Anything else a client sends is counted as `other`, so it cannot create new series
+KNOWN_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+INGEST_ROUTES = {'/post', '/post/batch'}
+
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+SIZE_BUCKETS = [1024 * 4 ** i for i in range(10)]  # 1 KB .. 256 MB
+
+REQUESTS_TOTAL = Counter('logvoyager_http_requests_total', 'HTTP requests by route, method and status',
+                         ('route', 'method', 'status'))
+REQUEST_DURATION = Histogram('logvoyager_http_request_duration_seconds', 'Time to build the response by route',
+                             LATENCY_BUCKETS, ('route',))
+INGEST_PHASE_DURATION = Histogram('logvoyager_ingest_phase_duration_seconds',
+                                  'Ingest time split into decode, parse, db_write, count and serialize',
+                                  LATENCY_BUCKETS, ('route', 'phase'))
+INGEST_PAYLOAD_BYTES = Histogram('logvoyager_ingest_payload_bytes', 'Request body size of ingest requests',
+                                 SIZE_BUCKETS, ('route',))
+INGEST_RUNS_TOTAL = Counter('logvoyager_ingest_runs_total', 'Runs stored', ('route',))
+COMPACTED_RUNS_TOTAL = Counter('logvoyager_compacted_runs_total', 'Runs rewritten by retention compaction')
+REQUESTS_IN_FLIGHT = Gauge('logvoyager_http_requests_in_flight', 'Requests currently being handled')
+INGEST_IN_FLIGHT = Gauge('logvoyager_ingest_requests_in_flight',
+                         'Ingest requests being parsed or waiting on MongoDB (the ingest queue)')
+MONGO_POOL_WAITING = Gauge('logvoyager_mongo_pool_waiting', 'Operations waiting for a free pooled MongoDB connection')
+MONGO_POOL_IN_USE = Gauge('logvoyager_mongo_pool_in_use', 'Pooled MongoDB connections checked out')
+COMPACTION_BACKLOG = Gauge('logvoyager_compaction_backlog_runs',
+                           'Runs due for a compaction rewrite, as of the last compaction pass')
+CACHE_RUN_BYTES = Gauge('logvoyager_cache_run_bytes', 'Bytes of run documents held in the read cache',
+                        lambda: response_cache.run_bytes)
+CACHE_RUN_ENTRIES = Gauge('logvoyager_cache_run_entries', 'Run documents held in the read cache',
+                          lambda: len(response_cache.runs))
+CACHE_VIEW_BYTES = Gauge('logvoyager_cache_view_bytes', 'Bytes of list and stats responses held in the read cache',
+                         lambda: response_cache.view_bytes)
+CACHE_VIEW_ENTRIES = Gauge('logvoyager_cache_view_entries', 'List and stats responses held in the read cache',
+                           lambda: len(response_cache.views))
+
+ALL_METRICS = [REQUESTS_TOTAL, REQUEST_DURATION, INGEST_PHASE_DURATION, INGEST_PAYLOAD_BYTES, INGEST_RUNS_TOTAL,
+               COMPACTED_RUNS_TOTAL, REQUESTS_IN_FLIGHT, INGEST_IN_FLIGHT, MONGO_POOL_WAITING, MONGO_POOL_IN_USE,
+               COMPACTION_BACKLOG, CACHE_RUN_BYTES, CACHE_RUN_ENTRIES,
+               CACHE_VIEW_BYTES, CACHE_VIEW_ENTRIES]
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """Feed the pool gauges from pymongo's connection pool events"""
+    
+    def connection_check_out_started(self, event):
+        MONGO_POOL_WAITING.inc()
+    
+    def connection_checked_out(self, event):
+        MONGO_POOL_WAITING.dec()
+        MONGO_POOL_IN_USE.inc()
+    
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_WAITING.dec()
+    
+    def connection_checked_in(self, event):
+        MONGO_POOL_IN_USE.dec()
+    
+    def pool_created(self, event):
+        pass
+    
+    def pool_ready(self, event):
+        pass
+    
+    def pool_cleared(self, event):
+        pass
+    
+    def pool_closed(self, event):
+        pass
+    
+    def connection_created(self, event):
+        pass
+    
+    def connection_ready(self, event):
+        pass
+    
+    def connection_closed(self, event):
+        pass
+
+MONGO_POOL_OPTIONS['event_listeners'] = [MongoPoolListener()]
+
+metrics_file = None
+metrics_dir_failed = False
+metrics_writer_lock = threading.Lock()
+
+def metrics_snapshot():
+    """This process's metric values, JSON-serializable"""
+    return {metric.name: metric.snapshot() for metric in ALL_METRICS}
+
+def write_metrics_snapshot():
+    """Replace this process's file in METRICS_DIR atomically"""
+    if metrics_file is None:
+        return
+    temporary = metrics_file + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(metrics_snapshot(), f)
+    os.replace(temporary, metrics_file)
+
+def metrics_writer_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            write_metrics_snapshot()
+        except OSError as e:
+            print(f"⚠️  Could not write metrics to {METRICS_DIR}: {e}")
+
+def ensure_metrics_writer():
+    """Start this worker's metrics file, once per process (the pid changes after fork)"""
+    global metrics_file, metrics_dir_failed
+    
+    with metrics_writer_lock:
+        if metrics_dir_failed:
+            return
+        if metrics_file is not None and os.path.basename(metrics_file).startswith(f"{os.getpid()}-"):
+            return
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+        except OSError as e:
+            # Metrics must never break ingest, fall back to this process's own numbers
+            metrics_dir_failed = True
+            print(f"⚠️  Could not create METRICS_DIR {METRICS_DIR}, /metrics covers this process only: {e}")
+            return
+        # The start time keeps a recycled pid from overwriting a dead worker's totals
+        metrics_file = os.path.join(METRICS_DIR, f"{os.getpid()}-{time.time_ns()}.json")
     
+    threading.Thread(target=metrics_writer_loop, name='logvoyager-metrics', daemon=True).start()
+    atexit.register(write_metrics_snapshot)
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def read_worker_snapshots():
+    """(alive, snapshot) of every other worker that wrote to METRICS_DIR"""
+    snapshots = []
+    try:
+        names = os.listdir(METRICS_DIR)
+    except OSError:
+        return snapshots
+    for name in names:
+        path = os.path.join(METRICS_DIR, name)
+        if not name.endswith('.json') or path == metrics_file:
+            continue
+        try:
+            pid = int(name.split('-', 1)[0])
+            with open(path, 'r') as f:
+                snapshots.append((process_alive(pid), json.load(f)))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+class PhaseTimer:
+    """Attribute the time since the previous mark to an ingest phase"""
+    
+    def __init__(self, route):
+        self.route = route
+        self.last = time.perf_counter()
+    
+    def mark(self, phase):
+        now = time.perf_counter()
+        INGEST_PHASE_DURATION.observe((self.route, phase), now - self.last)
+        self.last = now
+
+@collector.before_app_request
+def start_request_metrics():
+    if METRICS_DIR:
+        ensure_metrics_writer()
+    g.request_started = time.perf_counter()
+    REQUESTS_IN_FLIGHT.inc()
+    if request.url_rule is not None and request.url_rule.rule in INGEST_ROUTES:
+        g.ingest = True
+        INGEST_IN_FLIGHT.inc()
+
+@collector.after_app_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    method = request.method if request.method in KNOWN_METHODS else 'other'
+    REQUESTS_TOTAL.inc((route, method, str(response.status_code)))
+    if 'request_started' in g:
+        REQUEST_DURATION.observe((route,), time.perf_counter() - g.request_started)
+    return response
+
+@collector.teardown_app_request
+def finish_request_metrics(exc):
+    if 'request_started' in g:
+        REQUESTS_IN_FLIGHT.dec()
+    if g.pop('ingest', False):
+        INGEST_IN_FLIGHT.dec()
+
+def connect_mongodb():
+    """Try multiple connection strategies, returns a connected client or None"""
     # Strategy 1: Try with certifi CA bundle
     try:
         print("🔄 Attempting MongoDB connection (Strategy 1: certifi)...")
@@ -37,11 +546,12 @@ def connect_mongodb():
             tls=True,
             tlsCAFile=certifi.where(),
             retryWrites=True,
-            w='majority'
+            w='majority',
+            **MONGO_POOL_OPTIONS
         )
         client.admin.command('ping')
         print("✅ Strategy 1 successful!")
-        return True
+        return client
     except Exception as e:
         print(f"⚠️  Strategy 1 failed: {str(e)[:100]}")
     
@@ -56,11 +566,12 @@ def connect_mongodb():
             tls=True,
             tlsAllowInvalidCertificates=True,
             retryWrites=True,
-            w='majority'
+            w='majority',
+            **MONGO_POOL_OPTIONS
         )
         client.admin.command('ping')
         print("✅ Strategy 2 successful!")
-        return True
+        return client
     except Exception as e:
         print(f"⚠️  Strategy 2 failed: {str(e)[:100]}")
     
@@ -79,11 +590,12 @@ def connect_mongodb():
             tls=True,
             tlsAllowInvalidCertificates=True,
             retryWrites=True,
-            w='majority'
+            w='majority',
+            **MONGO_POOL_OPTIONS
         )
         client.admin.command('ping')
         print("✅ Strategy 3 successful!")
-        return True
+        return client
     except Exception as e:
         print(f"⚠️  Strategy 3 failed: {str(e)[:100]}")
     
@@ -98,43 +610,313 @@ def connect_mongodb():
             connectTimeoutMS=10000,
             socketTimeoutMS=10000,
             retryWrites=True,
-            w='majority'
+            w='majority',
+            **MONGO_POOL_OPTIONS
         )
         client.admin.command('ping')
         print("✅ Strategy 4 successful!")
-        return True
+        return client
     except Exception as e:
         print(f"⚠️  Strategy 4 failed: {str(e)[:100]}")
     
-    return False
+    return None
+
+def ensure_ttl_index(collection, db):
+    """TTL index on received_at, updated in place when RETENTION_DAYS changes"""
+    if RETENTION_DAYS <= 0:
+        # 0 disables expiry, so a TTL index left by an earlier setting must not keep deleting runs
+        for name, spec in collection.index_information().items():
+            if spec.get('key') == [('received_at', 1)] and 'expireAfterSeconds' in spec:
+                collection.drop_index(name)
+                print(f"🗑️  Dropped TTL index {name} on {collection.name} (RETENTION_DAYS=0)")
+        collection.create_index('received_at')
+        return
+    
+    expire_after = int(RETENTION_DAYS * 86400)
+    try:
+        collection.create_index('received_at', expireAfterSeconds=expire_after)
+    except OperationFailure:
+        db.command('collMod', collection.name,
+                   index={'keyPattern': {'received_at': 1}, 'expireAfterSeconds': expire_after})
 
-# Try to connect
-try:
-    if connect_mongodb():
+def ensure_retention_indexes(db):
+    """Indexes used by TTL expiry and the compaction passes"""
+    ensure_ttl_index(db[COLLECTION_NAME], db)
+    ensure_ttl_index(db[PROFILES_COLLECTION_NAME], db)
+    db[COLLECTION_NAME].create_index([('tier', 1), ('received_at', 1)])
+
+def create_collector_indexes(db):
+    """Every index the collector relies on, safe to run repeatedly"""
+    logs = db[COLLECTION_NAME]
+    logs.create_index('run_id', unique=True)
+    logs.create_index('receipt_timestamp')
+    logs.create_index('source')
+    logs.create_index('overview.hostname')
+    
+    # Profiles live next to their run and are compared per command
+    profiles = db[PROFILES_COLLECTION_NAME]
+    profiles.create_index('run_id', unique=True)
+    profiles.create_index([('command', 1), ('receipt_timestamp', -1)])
+    
+    ensure_retention_indexes(db)
+
+def bootstrap_indexes():
+    """One-time index setup with a short-lived client, before any worker starts.
+
+    Run as `python server.py --bootstrap-indexes` (gunicorn.conf.py does this
+    from the master), so workers skip index creation and nothing connected
+    is inherited across fork.
+    """
+    bootstrap_client = connect_mongodb()
+    if bootstrap_client is None:
+        print("❌ Index bootstrap skipped: MongoDB unreachable")
+        return False
+    try:
+        create_collector_indexes(bootstrap_client[DATABASE_NAME])
+        print(f"✅ Indexes ready on {DATABASE_NAME}.{COLLECTION_NAME} and {DATABASE_NAME}.{PROFILES_COLLECTION_NAME}")
+        return True
+    except Exception as e:
+        print(f"❌ Index bootstrap failed: {str(e)[:200]}")
+        return False
+    finally:
+        bootstrap_client.close()
+
+def init_mongodb(with_indexes=False):
+    """Connect this process to MongoDB and start its compaction thread, returns whether it is connected.
+
+    MongoClient is not fork-safe: a process forked after its parent connected
+    (the pid no longer matches) builds a client of its own. One thread
+    connects while the others keep answering, and a failed attempt is
+    retried on a later request after an exponential backoff.
+    """
+    global client, logs_collection, profiles_collection, MONGODB_CONNECTED
+    global connection_pid, connecting_pid, connect_failures, next_connect_attempt
+    
+    pid = os.getpid()
+    with connection_lock:
+        if connection_pid == pid:
+            return True
+        if connection_pid is not None:
+            # Connected in the parent process, that client is not usable here
+            client = None
+            logs_collection = None
+            profiles_collection = None
+            MONGODB_CONNECTED = False
+            connection_pid = None
+            connect_failures = 0
+            next_connect_attempt = 0.0
+        if connecting_pid == pid or time.monotonic() < next_connect_attempt:
+            return False
+        connecting_pid = pid
+    
+    new_client = connect_mongodb()
+    if new_client is not None and with_indexes:
+        try:
+            create_collector_indexes(new_client[DATABASE_NAME])
+        except Exception as e:
+            print(f"⚠️  Index creation failed: {str(e)[:200]}")
+    
+    with connection_lock:
+        connecting_pid = None
+        if new_client is None:
+            connect_failures += 1
+            delay = min(MONGO_RETRY_MAX_SECONDS, 2 ** connect_failures)
+            next_connect_attempt = time.monotonic() + delay
+            print("❌ MongoDB connection failed after all strategies")
+            print(f"⚠️  Server will run in fallback mode (memory only), retrying in {delay:.0f}s")
+            return False
+        
+        client = new_client
         db = client[DATABASE_NAME]
         logs_collection = db[COLLECTION_NAME]
-        
-        # Create indexes for better performance
-        logs_collection.create_index('run_id', unique=True)
-        logs_collection.create_index('receipt_timestamp')
-        logs_collection.create_index('source')
-        logs_collection.create_index('overview.hostname')
-        
-        print("✅ MongoDB connected successfully!")
-        print(f"   Database: {DATABASE_NAME}")
-        print(f"   Collection: {COLLECTION_NAME}")
+        profiles_collection = db[PROFILES_COLLECTION_NAME]
+        connect_failures = 0
+        connection_pid = pid
         MONGODB_CONNECTED = True
-    else:
-        raise Exception("All connection strategies failed")
-        
-except Exception as e:
-    print(f"❌ MongoDB connection failed after all strategies: {str(e)[:200]}")
-    print("⚠️  Server will run in fallback mode (memory only)")
-    MONGODB_CONNECTED = False
-    logs_collection = None
+    
+    print(f"✅ MongoDB connected successfully! (pid {pid})")
+    print(f"   Database: {DATABASE_NAME}")
+    print(f"   Collection: {COLLECTION_NAME}")
+    print(f"   Pool: {MONGO_POOL_OPTIONS['maxPoolSize']} connections max")
+    start_compaction()
+    return True
+
+def expand_logs(document):
+    """Restore the log bodies of a compressed run in place, so readers always see `logs`"""
+    compressed = document.pop('logs_compressed', None)
+    if compressed is not None:
+        document['logs'] = json.loads(zlib.decompress(compressed))
+    return document
+
+def excerpt_text(text, keep):
+    """First and last `keep` lines of a log body"""
+    lines = text.split('\n')
+    if len(lines) <= 2 * keep:
+        return text
+    removed = len(lines) - 2 * keep
+    return '\n'.join(lines[:keep] + [f"[logvoyager] ... {removed} lines removed by retention ..."] + lines[-keep:])
+
+def excerpt_logs(logs, keep):
+    """Cut every log body down to head/tail excerpts"""
+    excerpt = dict(logs)
+    for key in ('stdout', 'stderr'):
+        if isinstance(excerpt.get(key), str):
+            excerpt[key] = excerpt_text(excerpt[key], keep)
+    structured = excerpt.get('structured')
+    if isinstance(structured, list) and len(structured) > 2 * keep:
+        removed = len(structured) - 2 * keep
+        excerpt['structured'] = structured[:keep] + [f"[logvoyager] ... {removed} entries removed by retention ..."] + structured[-keep:]
+    return excerpt
+
+def backfill_received_at():
+    """Give runs stored before tiering a date-typed received_at so TTL and compaction see them"""
+    touched = 0
+    cursor = logs_collection.find(
+        {'received_at': {'$exists': False}},
+        {'_id': 1, 'receipt_timestamp': 1}
+    ).limit(COMPACTION_BATCH)
+    
+    for document in cursor:
+        try:
+            # Old receipt timestamps are naive local time
+            received_at = datetime.fromisoformat(document['receipt_timestamp']).astimezone(timezone.utc)
+        except (KeyError, TypeError, ValueError):
+            received_at = datetime.now(timezone.utc)
+        logs_collection.update_one(
+            {'_id': document['_id']},
+            {'$set': {'received_at': received_at, 'tier': 'hot'}}
+        )
+        touched += 1
+    return touched
+
+def excerpt_old_runs(cutoff):
+    """Reduce runs older than the excerpt horizon to head/tail excerpts"""
+    touched = 0
+    cursor = logs_collection.find(
+        {'tier': {'$in': ['hot', 'compressed']}, 'received_at': {'$lt': cutoff}},
+        {'_id': 1, 'run_id': 1, 'tier': 1, 'logs': 1, 'logs_compressed': 1}
+    ).limit(COMPACTION_BATCH)
+    
+    for document in cursor:
+        logs = expand_logs(document).get('logs', {})
+        logs_collection.update_one(
+            {'_id': document['_id'], 'tier': document['tier']},
+            {
+                '$set': {'logs': excerpt_logs(logs, RETENTION_EXCERPT_LINES), 'tier': 'excerpt',
+                         'tier_changed_at': datetime.now(timezone.utc)},
+                '$unset': {'logs_compressed': ''}
+            }
+        )
+        response_cache.evict_run(document.get('run_id'))
+        touched += 1
+    return touched
+
+def compress_old_runs(cutoff):
+    """Move the log bodies of runs past the hot horizon into a zlib-compressed field"""
+    touched = 0
+    cursor = logs_collection.find(
+        {'tier': 'hot', 'received_at': {'$lt': cutoff}},
+        {'_id': 1, 'run_id': 1, 'logs': 1}
+    ).limit(COMPACTION_BATCH)
+    
+    for document in cursor:
+        raw = json.dumps(document.get('logs', {})).encode('utf-8')
+        logs_collection.update_one(
+            {'_id': document['_id'], 'tier': 'hot'},
+            {
+                '$set': {'logs_compressed': zlib.compress(raw, 6), 'logs_bytes': len(raw), 'tier': 'compressed',
+                         'tier_changed_at': datetime.now(timezone.utc)},
+                '$unset': {'logs': ''}
+            }
+        )
+        response_cache.evict_run(document.get('run_id'))
+        touched += 1
+    return touched
+
+def compact_once():
+    """One incremental compaction pass of at most COMPACTION_BATCH runs per step"""
+    now = datetime.now(timezone.utc)
+    touched = backfill_received_at()
+    
+    # Excerpt first so runs that are already past both horizons are rewritten once
+    if RETENTION_EXCERPT_DAYS > 0:
+        touched += excerpt_old_runs(now - timedelta(days=RETENTION_EXCERPT_DAYS))
+    if RETENTION_HOT_DAYS > 0:
+        touched += compress_old_runs(now - timedelta(days=RETENTION_HOT_DAYS))
+    return touched
+
+def acquire_compaction_lock():
+    """Non-blocking exclusive lock on COMPACTION_LOCK_FILE, the open file while held or None"""
+    try:
+        lock_file = open(COMPACTION_LOCK_FILE, 'a')
+    except OSError as e:
+        print(f"⚠️  Cannot open compaction lock {COMPACTION_LOCK_FILE}: {e}")
+        return None
+    try:
+        import fcntl
+    except ImportError:
+        # No flock (Windows): no gunicorn either, so this is the only process compacting
+        return lock_file
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+def compaction_backlog():
+    """Runs the next compaction passes still have to rewrite or backfill"""
+    now = datetime.now(timezone.utc)
+    due = [{'received_at': {'$exists': False}}]
+    if RETENTION_EXCERPT_DAYS > 0:
+        due.append({'tier': {'$in': ['hot', 'compressed']},
+                    'received_at': {'$lt': now - timedelta(days=RETENTION_EXCERPT_DAYS)}})
+    if RETENTION_HOT_DAYS > 0:
+        due.append({'tier': 'hot', 'received_at': {'$lt': now - timedelta(days=RETENTION_HOT_DAYS)}})
+    return logs_collection.count_documents({'$or': due})
+
+def compaction_loop():
+    """Background compaction: short steps while there is a backlog, then idle.
+
+    Every worker runs this loop but only the lock holder compacts; the lock
+    is released when its process exits, and a standby takes over on its
+    next tick. Across hosts the passes stay safe because every rewrite is
+    conditional on the tier it read.
+    """
+    lock_file = None
+    while True:
+        if lock_file is None:
+            lock_file = acquire_compaction_lock()
+            if lock_file is None:
+                time.sleep(COMPACTION_INTERVAL)
+                continue
+        try:
+            touched = compact_once()
+            if touched:
+                COMPACTED_RUNS_TOTAL.inc((), touched)
+                print(f"🗜️  Compaction: {touched} runs updated")
+            COMPACTION_BACKLOG.set(compaction_backlog())
+        except Exception as e:
+            print(f"⚠️  Compaction pass failed: {str(e)[:200]}")
+            touched = 0
+        time.sleep(1 if touched else COMPACTION_INTERVAL)
+
+def start_compaction():
+    """Start the compaction thread if the database is up and compaction is enabled"""
+    if not MONGODB_CONNECTED or COMPACTION_INTERVAL <= 0:
+        return None
+    thread = threading.Thread(target=compaction_loop, name='logvoyager-compaction', daemon=True)
+    thread.start()
+    return thread
+
+@collector.before_app_request
+def ensure_mongodb():
+    """Connect lazily on the first request each worker process serves, retrying after a backoff while down"""
+    if connection_pid != os.getpid():
+        init_mongodb()
 
 # Health check endpoint at root
-@app.route('/', methods=['GET'])
+@collector.route('/', methods=['GET'])
 def health_check():
     """Health check endpoint to verify server is running"""
     try:
@@ -166,7 +948,246 @@ def health_check():
             "message": str(e)
         }), 500
 
-@app.route('/post', methods=['POST', 'OPTIONS'])
+def payload_run_id(raw_data):
+    """Run ID derived from the payload, so a retried upload maps onto the run it already stored"""
+    digest = hashlib.blake2b(digest_size=16)
+    for key in ('timestamp', 'source', 'type', 'data'):
+        digest.update(str(raw_data.get(key, '')).encode('utf-8', 'replace'))
+        digest.update(b'\0')
+    return str(uuid.UUID(bytes=digest.digest(), version=5))
+
+def validate_payload(raw_data):
+    """Reason a runner payload cannot be stored, None when it is fine"""
+    if not isinstance(raw_data, dict):
+        return "payload must be a JSON object"
+    if not isinstance(raw_data.get('data'), str) or not raw_data['data']:
+        return "payload needs a non-empty 'data' string"
+    if 'profile' in raw_data and raw_data['profile'] is not None and not isinstance(raw_data['profile'], dict):
+        return "'profile' must be a JSON object"
+    return None
+
+def insert_ignoring_duplicates(collection, documents):
+    """insert_many that treats runs already stored by an earlier attempt as done, returns how many were duplicates"""
+    try:
+        collection.insert_many(documents, ordered=False)
+        return 0
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        if e.details.get('writeConcernErrors') or any(error.get('code') != 11000 for error in errors):
+            raise
+        return len(errors)
+
+def is_transient_mongo_error(error):
+    """Lost connections, failovers and timeouts (the pool wait queue included) that a retry can get past"""
+    return isinstance(error, ConnectionFailure) or (isinstance(error, PyMongoError) and error.timeout)
+
+def build_structured_data(raw_data):
+    """Parse a raw runner payload into the structured document stored in MongoDB"""
+    # Parse the raw data string to extract different components
+    data_str = raw_data.get('data', '')
+    
+    # Same payload, same run ID: retries are stored once thanks to the unique index
+    run_id = payload_run_id(raw_data)
+    
+    # Initialize structured data
+    structured_data = {
+        'run_id': run_id,
+        'overview': {},
+        'system_stats': {},
+        'logs': {},
+        'files': [],
+        'file_contents': {},
+        'errors': [],
+        'source': raw_data.get('source', 'unknown'),
+        'type': raw_data.get('type', 'unknown'),
+        'timestamp': raw_data.get('timestamp', datetime.now().isoformat()),
+        'receipt_timestamp': datetime.now().isoformat(),
+        # Date-typed copy of the receipt time, used by TTL expiry and compaction
+        'received_at': datetime.now(timezone.utc),
+        'tier': 'hot'
+    }
+    
+    # Extract overview information
+    if 'Start time:' in data_str:
+        start_time_line = data_str.split('Start time:')[1].split('\n')[0].strip()
+        structured_data['overview']['start_time'] = start_time_line
+        
+    if 'Runtime:' in data_str:
+        runtime_line = data_str.split('Runtime:')[1].split('\n')[0].strip()
+        structured_data['overview']['runtime'] = runtime_line
+        
+    if 'Tracked hours:' in data_str:
+        tracked_line = data_str.split('Tracked hours:')[1].split('\n')[0].strip()
+        structured_data['overview']['tracked_hours'] = tracked_line
+        
+    if 'Run path:' in data_str:
+        path_line = data_str.split('Run path:')[1].split('\n')[0].strip()
+        structured_data['overview']['run_path'] = path_line
+        
+    if 'Hostname:' in data_str:
+        hostname_line = data_str.split('Hostname:')[1].split('\n')[0].strip()
+        structured_data['overview']['hostname'] = hostname_line
+        
+    if 'OS:' in data_str:
+        os_line = data_str.split('OS:')[1].split('\n')[0].strip()
+        structured_data['overview']['os'] = os_line
+        
+    if 'Python version:' in data_str:
+        py_version_line = data_str.split('Python version:')[1].split('\n')[0].strip()
+        structured_data['overview']['python_version'] = py_version_line
+        
+    if 'Python executable:' in data_str:
+        py_exec_line = data_str.split('Python executable:')[1].split('\n')[0].strip()
+        structured_data['overview']['python_executable'] = py_exec_line
+        
+    if 'Command:' in data_str:
+        command_line = data_str.split('Command:')[1].split('\n')[0].strip()
+        structured_data['overview']['command'] = command_line
+        
+    if 'Return code:' in data_str:
+        return_code_line = data_str.split('Return code:')[1].split('\n')[0].strip()
+        structured_data['overview']['return_code'] = return_code_line
+    
+    # Extract directory listing
+    if 'Directory Listing' in data_str:
+        try:
+            listing_section = data_str.split('Directory Listing')[1].split('Return code:')[0]
+            listing_lines = listing_section.strip().split('\n')
+            
+            for line in listing_lines:
+                line = line.strip()
+                if line.startswith('[DIR]'):
+                    dir_name = line.replace('[DIR]', '').strip()
+                    structured_data['files'].append({
+                        'type': 'directory',
+                        'name': dir_name,
+                        'size': None
+                    })
+                elif line.startswith('[FILE]'):
+                    file_info = line.replace('[FILE]', '').strip()
+                    if '(' in file_info and 'bytes)' in file_info:
+                        name = file_info.split('(')[0].strip()
+                        size_str = file_info.split('(')[1].split('bytes')[0].strip()
+                        structured_data['files'].append({
+                            'type': 'file',
+                            'name': name,
+                            'size': int(size_str)
+                        })
+        except Exception as e:
+            print(f"Warning: Could not parse directory listing: {e}")
+    
+    # Extract system stats
+    for metric_section in ['BEFORE', 'AFTER', 'DIFFERENCE']:
+        section_key = f'--- SYSTEM METRICS {metric_section} ---'
+        if section_key in data_str:
+            section_data = data_str.split(section_key)[1].split('---')[0]
+            metrics = {}
+            for line in section_data.strip().split('\n'):
+                if ':' in line:
+                    key, value = line.split(':', 1)
+                    metrics[key.strip()] = value.strip()
+            structured_data['system_stats'][metric_section.lower()] = metrics
+    
+    # Extract logs
+    if '--- STDOUT ---' in data_str:
+        stdout_data = data_str.split('--- STDOUT ---')[1].split('---')[0].strip()
+        structured_data['logs']['stdout'] = stdout_data
+    
+    if '--- STDERR ---' in data_str:
+        stderr_data = data_str.split('--- STDERR ---')[1].split('---')[0].strip()
+        structured_data['logs']['stderr'] = stderr_data
+    
+    if '--- STRUCTURED LOGS ---' in data_str:
+        logs_data = data_str.split('--- STRUCTURED LOGS ---')[1].split('---')[0].strip()
+        structured_data['logs']['structured'] = logs_data.split('\n')
+    
+    # Counters of lines the runner's output policies left out
+    if '--- OUTPUT POLICY ---' in data_str:
+        policy_data = data_str.split('--- OUTPUT POLICY ---')[1].split('---')[0]
+        counters = {}
+        for line in policy_data.strip().split('\n'):
+            if ':' in line:
+                key, value = line.split(':', 1)
+                try:
+                    counters[key.strip()] = int(value.strip())
+                except ValueError:
+                    pass
+        structured_data['logs']['output_policy'] = counters
+    
+    return structured_data
+
+def summarize_profile(stacks, limit=50, cumulative=None, with_totals=True):
+    """Hottest functions of a collapsed-stack profile by self weight, with inclusive weight
+    
+    Inclusive weight comes from the stacks unless `cumulative` gives it per
+    function. With `with_totals=False` it is left out.
+    """
+    self_weight = {}
+    total_weight = {}
+    
+    for line in stacks.split('\n'):
+        stack, _, count = line.rpartition(' ')
+        if not stack or not count.isdigit():
+            continue
+        count = int(count)
+        frames = stack.split(';')
+        self_weight[frames[-1]] = self_weight.get(frames[-1], 0) + count
+        # Recursive functions appear several times in one stack but count once
+        for frame in set(frames):
+            total_weight[frame] = total_weight.get(frame, 0) + count
+    
+    if cumulative is not None:
+        total_weight = {function: cumulative.get(function, weight) for function, weight in total_weight.items()}
+    
+    grand_total = sum(self_weight.values()) or 1
+    hottest = sorted(total_weight, key=lambda f: (self_weight.get(f, 0), total_weight[f]), reverse=True)
+    
+    summary = []
+    for function in hottest[:limit]:
+        entry = {
+            'function': function,
+            'self': self_weight.get(function, 0),
+            'self_percent': round(100 * self_weight.get(function, 0) / grand_total, 2)
+        }
+        if with_totals:
+            entry['total'] = total_weight[function]
+            entry['total_percent'] = round(100 * total_weight[function] / grand_total, 2)
+        summary.append(entry)
+    return summary
+
+def build_profile_document(raw_data, structured_data):
+    """Profile document stored next to a run, or None when the run was not profiled"""
+    profile = raw_data.get('profile')
+    if not isinstance(profile, dict) or not profile.get('stacks'):
+        return None
+    
+    stacks = str(profile['stacks'])
+    profiler = profile.get('profiler', 'unknown')
+    cumulative = None
+    with_totals = True
+    if profiler == 'cprofile':
+        # cProfile stacks are caller;callee pairs, inclusive time only comes from its cumulative times
+        try:
+            cumulative = {str(function): int(weight) for function, weight in profile.get('cumulative').items()}
+        except (AttributeError, TypeError, ValueError):
+            with_totals = False
+    
+    return {
+        'run_id': structured_data['run_id'],
+        'command': structured_data['overview'].get('command', ''),
+        'hostname': structured_data['overview'].get('hostname', ''),
+        'receipt_timestamp': structured_data['receipt_timestamp'],
+        'received_at': structured_data['received_at'],
+        'profiler': profiler,
+        'unit': profile.get('unit', 'samples'),
+        'interval': profile.get('interval'),
+        'samples': profile.get('samples'),
+        'duration': profile.get('duration'),
+        'stacks': stacks,
+        'top_functions': summarize_profile(stacks, cumulative=cumulative, with_totals=with_totals)
+    }
+
+@collector.route('/post', methods=['POST', 'OPTIONS'])
 def receive_data():
     """Receive and store monitoring data"""
     # Handle CORS preflight
@@ -185,8 +1206,12 @@ def receive_data():
                 "message": "Database not available - MongoDB connection failed"
             }), 503
         
+        timer = PhaseTimer('/post')
+        INGEST_PAYLOAD_BYTES.observe(('/post',), request.content_length or 0)
+        
         # Get the JSON data from the request
         raw_data = request.get_json()
+        timer.mark('decode')
         
         if not raw_data:
             return jsonify({
@@ -194,141 +1219,54 @@ def receive_data():
                 "message": "No JSON data received"
             }), 400
         
-        # Parse the raw data string to extract different components
-        data_str = raw_data.get('data', '')
-        
-        # Generate unique run ID
-        run_id = str(uuid.uuid4())
-        
-        # Initialize structured data
-        structured_data = {
-            'run_id': run_id,
-            'overview': {},
-            'system_stats': {},
-            'logs': {},
-            'files': [],
-            'file_contents': {},
-            'errors': [],
-            'source': raw_data.get('source', 'unknown'),
-            'type': raw_data.get('type', 'unknown'),
-            'timestamp': raw_data.get('timestamp', datetime.now().isoformat()),
-            'receipt_timestamp': datetime.now().isoformat()
-        }
+        problem = validate_payload(raw_data)
+        if problem:
+            return jsonify({
+                "status": "error",
+                "message": problem
+            }), 400
         
-        # Extract overview information
-        if 'Start time:' in data_str:
-            start_time_line = data_str.split('Start time:')[1].split('\n')[0].strip()
-            structured_data['overview']['start_time'] = start_time_line
-            
-        if 'Runtime:' in data_str:
-            runtime_line = data_str.split('Runtime:')[1].split('\n')[0].strip()
-            structured_data['overview']['runtime'] = runtime_line
-            
-        if 'Tracked hours:' in data_str:
-            tracked_line = data_str.split('Tracked hours:')[1].split('\n')[0].strip()
-            structured_data['overview']['tracked_hours'] = tracked_line
-            
-        if 'Run path:' in data_str:
-            path_line = data_str.split('Run path:')[1].split('\n')[0].strip()
-            structured_data['overview']['run_path'] = path_line
-            
-        if 'Hostname:' in data_str:
-            hostname_line = data_str.split('Hostname:')[1].split('\n')[0].strip()
-            structured_data['overview']['hostname'] = hostname_line
-            
-        if 'OS:' in data_str:
-            os_line = data_str.split('OS:')[1].split('\n')[0].strip()
-            structured_data['overview']['os'] = os_line
-            
-        if 'Python version:' in data_str:
-            py_version_line = data_str.split('Python version:')[1].split('\n')[0].strip()
-            structured_data['overview']['python_version'] = py_version_line
-            
-        if 'Python executable:' in data_str:
-            py_exec_line = data_str.split('Python executable:')[1].split('\n')[0].strip()
-            structured_data['overview']['python_executable'] = py_exec_line
-            
-        if 'Command:' in data_str:
-            command_line = data_str.split('Command:')[1].split('\n')[0].strip()
-            structured_data['overview']['command'] = command_line
-            
-        if 'Return code:' in data_str:
-            return_code_line = data_str.split('Return code:')[1].split('\n')[0].strip()
-            structured_data['overview']['return_code'] = return_code_line
+        structured_data = build_structured_data(raw_data)
+        run_id = structured_data['run_id']
+        profile_document = build_profile_document(raw_data, structured_data)
+        structured_data['has_profile'] = profile_document is not None
+        timer.mark('parse')
         
-        # Extract directory listing
-        if 'Directory Listing' in data_str:
+        # Insert into MongoDB; a duplicate run ID is a retry of a run that is already stored
+        duplicate = False
+        try:
+            logs_collection.insert_one(structured_data)
+        except DuplicateKeyError:
+            duplicate = True
+        if profile_document is not None:
             try:
-                listing_section = data_str.split('Directory Listing')[1].split('Return code:')[0]
-                listing_lines = listing_section.strip().split('\n')
-                
-                for line in listing_lines:
-                    line = line.strip()
-                    if line.startswith('[DIR]'):
-                        dir_name = line.replace('[DIR]', '').strip()
-                        structured_data['files'].append({
-                            'type': 'directory',
-                            'name': dir_name,
-                            'size': None
-                        })
-                    elif line.startswith('[FILE]'):
-                        file_info = line.replace('[FILE]', '').strip()
-                        if '(' in file_info and 'bytes)' in file_info:
-                            name = file_info.split('(')[0].strip()
-                            size_str = file_info.split('(')[1].split('bytes')[0].strip()
-                            structured_data['files'].append({
-                                'type': 'file',
-                                'name': name,
-                                'size': int(size_str)
-                            })
-            except Exception as e:
-                print(f"Warning: Could not parse directory listing: {e}")
-        
-        # Extract system stats
-        for metric_section in ['BEFORE', 'AFTER', 'DIFFERENCE']:
-            section_key = f'--- SYSTEM METRICS {metric_section} ---'
-            if section_key in data_str:
-                section_data = data_str.split(section_key)[1].split('---')[0]
-                metrics = {}
-                for line in section_data.strip().split('\n'):
-                    if ':' in line:
-                        key, value = line.split(':', 1)
-                        metrics[key.strip()] = value.strip()
-                structured_data['system_stats'][metric_section.lower()] = metrics
-        
-        # Extract logs
-        if '--- STDOUT ---' in data_str:
-            stdout_data = data_str.split('--- STDOUT ---')[1].split('---')[0].strip()
-            structured_data['logs']['stdout'] = stdout_data
-        
-        if '--- STDERR ---' in data_str:
-            stderr_data = data_str.split('--- STDERR ---')[1].split('---')[0].strip()
-            structured_data['logs']['stderr'] = stderr_data
-        
-        if '--- STRUCTURED LOGS ---' in data_str:
-            logs_data = data_str.split('--- STRUCTURED LOGS ---')[1].split('---')[0].strip()
-            structured_data['logs']['structured'] = logs_data.split('\n')
-        
-        # Insert into MongoDB
-        result = logs_collection.insert_one(structured_data)
+                profiles_collection.insert_one(profile_document)
+            except DuplicateKeyError:
+                pass
+        if not duplicate:
+            response_cache.invalidate_views()
+            INGEST_RUNS_TOTAL.inc(('/post',))
+        timer.mark('db_write')
         
         # Get total count
         total_logs = logs_collection.count_documents({})
+        timer.mark('count')
         
         print(f"✅ Data received: {structured_data['type']} at {structured_data['receipt_timestamp']}")
-        print(f"   Run ID: {run_id}")
-        print(f"   MongoDB ID: {result.inserted_id}")
+        print(f"   Run ID: {run_id}{' (already stored)' if duplicate else ''}")
         print(f"   Total logs: {total_logs}")
         
         # Return success response
         response = jsonify({
             "status": "success", 
-            "message": "Structured data received and stored successfully",
+            "message": "Run was already stored" if duplicate else "Structured data received and stored successfully",
             "run_id": run_id,
+            "duplicate": duplicate,
             "stored_at": structured_data['receipt_timestamp'],
             "total_logs": total_logs
         })
         response.headers.add('Access-Control-Allow-Origin', '*')
+        timer.mark('serialize')
         return response, 200
         
     except Exception as e:
@@ -341,9 +1279,102 @@ def receive_data():
             "message": f"Failed to receive data: {str(e)}"
         })
         response.headers.add('Access-Control-Allow-Origin', '*')
-        return response, 500
+        # 503 tells clients to retry, 500 that this payload itself failed
+        return response, 503 if is_transient_mongo_error(e) else 500
+
+@collector.route('/post/batch', methods=['POST'])
+def receive_batch():
+    """Receive and store a batch of monitoring payloads (used by the pymon agent)"""
+    try:
+        if not MONGODB_CONNECTED or logs_collection is None:
+            return jsonify({
+                "status": "error",
+                "message": "Database not available - MongoDB connection failed"
+            }), 503
+        
+        timer = PhaseTimer('/post/batch')
+        INGEST_PAYLOAD_BYTES.observe(('/post/batch',), request.content_length or 0)
+        
+        raw_data = request.get_json()
+        payloads = raw_data.get('payloads') if isinstance(raw_data, dict) else None
+        timer.mark('decode')
+        
+        if not payloads or not isinstance(payloads, list):
+            return jsonify({
+                "status": "error",
+                "message": "Expected a non-empty 'payloads' list"
+            }), 400
+        
+        # Bad payloads are skipped and reported by index, the rest of the batch is stored
+        documents = []
+        profile_documents = []
+        rejected = []
+        for index, payload in enumerate(payloads):
+            problem = validate_payload(payload)
+            if problem is None:
+                try:
+                    document = build_structured_data(payload)
+                    profile_document = build_profile_document(payload, document)
+                except Exception as e:
+                    problem = f"could not be parsed: {str(e)[:200]}"
+            if problem:
+                rejected.append({"index": index, "error": problem})
+                continue
+            document['has_profile'] = profile_document is not None
+            documents.append(document)
+            if profile_document is not None:
+                profile_documents.append(profile_document)
+        run_ids = [document['run_id'] for document in documents]
+        timer.mark('parse')
+        
+        if not documents:
+            return jsonify({
+                "status": "error",
+                "message": "No valid payloads in the batch",
+                "rejected": rejected
+            }), 400
+        
+        # One round trip for the whole batch. Run IDs are derived from the payloads, so
+        # a batch retried after a partial write only adds the runs that are missing
+        duplicates = insert_ignoring_duplicates(logs_collection, documents)
+        if profile_documents:
+            insert_ignoring_duplicates(profiles_collection, profile_documents)
+        if duplicates < len(documents):
+            response_cache.invalidate_views()
+        INGEST_RUNS_TOTAL.inc(('/post/batch',), len(documents) - duplicates)
+        timer.mark('db_write')
+        
+        total_logs = logs_collection.count_documents({})
+        timer.mark('count')
+        
+        print(f"✅ Batch received: {len(documents)} runs ({duplicates} already stored, {len(rejected)} rejected)")
+        print(f"   Total logs: {total_logs}")
+        
+        response = jsonify({
+            "status": "success",
+            "message": f"Stored {len(documents) - duplicates} runs",
+            "run_ids": run_ids,
+            "duplicates": duplicates,
+            "rejected": rejected,
+            "total_logs": total_logs
+        })
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        timer.mark('serialize')
+        return response, 200
+        
+    except Exception as e:
+        print(f"❌ Error receiving batch: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        
+        response = jsonify({
+            "status": "error",
+            "message": f"Failed to receive batch: {str(e)}"
+        })
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 503 if is_transient_mongo_error(e) else 500
 
-@app.route('/view', methods=['GET'])
+@collector.route('/view', methods=['GET'])
 def view_data():
     """Endpoint to view stored data with pagination"""
     try:
@@ -351,54 +1382,301 @@ def view_data():
             return jsonify({"error": "Database not available"}), 503
         
         # Pagination parameters
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 50))
+        page = max(1, int(request.args.get('page', 1)))
+        limit = min(max(1, int(request.args.get('limit', 50))), VIEW_MAX_LIMIT)
         skip = (page - 1) * limit
         
+        cache_key = ('view', page, limit)
+        entry = response_cache.get_view(cache_key)
+        if entry is not None:
+            return cached_json_response(entry)
+        generation = response_cache.generation
+        
         # Get total count
         total = logs_collection.count_documents({})
         
         # Get paginated data (sorted by receipt_timestamp descending)
         cursor = logs_collection.find({}, {'_id': 0}).sort('receipt_timestamp', -1).skip(skip).limit(limit)
-        data = list(cursor)
+        data = [expand_logs(document) for document in cursor]
         
-        response = jsonify({
+        entry = ResponseCache.make_entry({
             'total': total,
             'page': page,
             'limit': limit,
             'pages': (total + limit - 1) // limit,
             'data': data
-        })
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response, 200
+        }, datetime.now(timezone.utc))
+        response_cache.put_view(cache_key, entry, generation)
+        return cached_json_response(entry)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/view/<run_id>', methods=['GET'])
+@collector.route('/view/<run_id>', methods=['GET'])
 def view_run(run_id):
     """View a specific run by ID"""
     try:
         if not MONGODB_CONNECTED or logs_collection is None:
             return jsonify({"error": "Database not available"}), 503
         
+        cached = response_cache.get_run(run_id)
+        if cached is not None and not cached_run_is_current(cached):
+            # Compacted by another worker or deleted by the TTL index since it was cached
+            response_cache.evict_run(run_id)
+            cached = None
+        if cached is not None:
+            return cached_json_response(cached)
+        
         entry = logs_collection.find_one({'run_id': run_id}, {'_id': 0})
         
         if entry:
-            response = jsonify(entry)
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 200
+            received_at = entry.get('received_at') or datetime.now(timezone.utc)
+            tier = entry.get('tier', 'hot')
+            # The body last changed when compaction rewrote it; runs compacted before that was
+            # recorded have no known time and are revalidated by ETag only
+            last_modified = entry.get('tier_changed_at') or (received_at if tier == 'hot' else None)
+            cached = ResponseCache.make_entry(expand_logs(entry), last_modified)
+            cached['tier'] = tier
+            cached['received_at'] = received_at
+            if not cached_run_is_current(cached):
+                # Compaction has not reached this run yet, do not re-read it on every hit
+                cached['recheck_at'] = time.monotonic() + STALE_RUN_RECHECK_SECONDS
+            response_cache.put_run(run_id, cached)
+            return cached_json_response(cached)
         else:
             return jsonify({"error": "Run ID not found"}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/stats', methods=['GET'])
+def parse_export_time(value):
+    """ISO 8601 query parameter as an aware datetime, naive values are taken as UTC"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+def export_default(value):
+    """JSON encoding for the BSON types that show up in run documents"""
+    if isinstance(value, datetime):
+        # pymongo returns naive datetimes that are UTC, say so explicitly
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, bytes):
+        return None
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def project_logs(document, log_fields):
+    """Keep only the requested logs.* paths, for runs whose whole log body came back from expand_logs"""
+    logs = document.get('logs')
+    if not isinstance(logs, dict):
+        return document
+    projected = {}
+    for field in log_fields:
+        *parents, leaf = field.split('.')[1:]
+        source = logs
+        target = projected
+        for part in parents:
+            source = source.get(part) if isinstance(source, dict) else None
+            target = target.setdefault(part, {})
+        if isinstance(source, dict) and leaf in source:
+            target[leaf] = source[leaf]
+    document['logs'] = projected
+    return document
+
+@collector.route('/export', methods=['GET'])
+def export_data():
+    """Stream runs as newline-delimited JSON straight from a server-side cursor.
+    
+    Query parameters:
+      since, until  ISO 8601 bounds on the receipt time
+      host          hostname, or several separated by commas
+      fields        comma-separated projection (run_id and _id are always included)
+      after         resume token: the _id of the last line already received, exact
+                    only for runs received a few seconds before that line was exported
+      limit         stop after this many runs
+      batch_size    documents per cursor round trip
+      gzip=1        gzip the stream (Content-Encoding: gzip)
+    """
+    try:
+        if not MONGODB_CONNECTED or logs_collection is None:
+            return jsonify({"error": "Database not available"}), 503
+        
+        query = {}
+        try:
+            received = {}
+            if request.args.get('since'):
+                received['$gte'] = parse_export_time(request.args['since'])
+            if request.args.get('until'):
+                received['$lt'] = parse_export_time(request.args['until'])
+            if received:
+                query['received_at'] = received
+            if request.args.get('after'):
+                query['_id'] = {'$gt': ObjectId(request.args['after'])}
+            limit = int(request.args.get('limit', 0))
+            batch_size = int(request.args.get('batch_size', EXPORT_BATCH_SIZE))
+        except (ValueError, InvalidId) as e:
+            return jsonify({"error": f"Invalid export parameter: {str(e)}"}), 400
+        
+        hosts = [host for host in request.args.get('host', '').split(',') if host]
+        if hosts:
+            query['overview.hostname'] = {'$in': hosts}
+        
+        projection = None
+        log_fields = []
+        fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+        if fields:
+            # MongoDB refuses a projection with a field and one of its subfields (logs, logs.stdout)
+            projected = set(fields + ['run_id', '_id'])
+            overlapping = sorted(f"{parent}, {field}" for parent in projected for field in projected
+                                 if field.startswith(parent + '.'))
+            if overlapping:
+                return jsonify({"error": f"Overlapping export fields: {'; '.join(overlapping)}"}), 400
+            projection = {field: 1 for field in projected}
+            # Compressed runs keep their log bodies in a separate field, inflated whole
+            if any(field == 'logs' or field.startswith('logs.') for field in fields):
+                projection['logs_compressed'] = 1
+            if 'logs' not in fields:
+                log_fields = [field for field in fields if field.startswith('logs.')]
+        
+        # ObjectIds order by second, then by a per-process counter: runs written in the same
+        # second by other workers or hosts can sort before the last _id a client received
+        cursor = logs_collection.find(query, projection).sort('_id', 1).batch_size(max(1, batch_size))
+        if limit > 0:
+            cursor = cursor.limit(limit)
+        
+        use_gzip = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+        
+        # The first batch is fetched before the headers go out, so a failing query is still an error status
+        documents = iter(cursor)
+        first = next(documents, None)
+        if first is not None:
+            documents = itertools.chain([first], documents)
+        
+        def generate():
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+            chunk = []
+            chunk_bytes = 0
+            try:
+                for document in documents:
+                    compressed = 'logs_compressed' in document
+                    document = expand_logs(document)
+                    if compressed and log_fields:
+                        # Hot runs were already projected by MongoDB, give compressed ones the same shape
+                        document = project_logs(document, log_fields)
+                    line = json.dumps(document, default=export_default).encode('utf-8') + b'\n'
+                    chunk.append(line)
+                    chunk_bytes += len(line)
+                    if chunk_bytes >= EXPORT_CHUNK_BYTES:
+                        data = b''.join(chunk)
+                        chunk = []
+                        chunk_bytes = 0
+                        yield compressor.compress(data) if compressor else data
+                
+                data = b''.join(chunk)
+                if compressor:
+                    yield compressor.compress(data) + compressor.flush()
+                elif data:
+                    yield data
+            finally:
+                cursor.close()
+        
+        response = current_app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response
+    except Exception as e:
+        return jsonify({"error": str(e)}), 503 if is_transient_mongo_error(e) else 500
+
+@collector.route('/profile/<run_id>', methods=['GET'])
+def view_profile(run_id):
+    """View the profile of a run, as JSON or as raw collapsed stacks (?format=collapsed)"""
+    try:
+        if not MONGODB_CONNECTED or profiles_collection is None:
+            return jsonify({"error": "Database not available"}), 503
+        
+        entry = profiles_collection.find_one({'run_id': run_id}, {'_id': 0})
+        
+        if not entry:
+            return jsonify({"error": "No profile for this run ID"}), 404
+        
+        if request.args.get('format') == 'collapsed':
+            # Feed straight into flamegraph.pl / speedscope
+            response = current_app.response_class(entry['stacks'] + '\n', mimetype='text/plain')
+        else:
+            response = jsonify(entry)
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@collector.route('/profiles', methods=['GET'])
+def compare_profiles():
+    """Compare the hottest functions across recent profiled runs of the same command"""
+    try:
+        if not MONGODB_CONNECTED or profiles_collection is None:
+            return jsonify({"error": "Database not available"}), 503
+        
+        command = request.args.get('command')
+        if not command:
+            return jsonify({"error": "Missing 'command' parameter"}), 400
+        
+        limit = int(request.args.get('limit', 10))
+        top = int(request.args.get('top', 20))
+        
+        cursor = profiles_collection.find(
+            {'command': command},
+            {'_id': 0, 'stacks': 0}
+        ).sort('receipt_timestamp', -1).limit(limit)
+        runs = list(cursor)
+        
+        # Self percentage of each hot function per run, oldest run first
+        runs.reverse()
+        functions = {}
+        for index, run in enumerate(runs):
+            run['top_functions'] = run['top_functions'][:top]
+            for entry in run['top_functions']:
+                functions.setdefault(entry['function'], [None] * len(runs))[index] = entry['self_percent']
+        
+        response = jsonify({
+            'command': command,
+            'runs': runs,
+            'functions': functions
+        })
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@collector.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Server metrics in the Prometheus text exposition format, totals over all worker processes"""
+    processes = [(True, metrics_snapshot())]
+    if METRICS_DIR:
+        processes.extend(read_worker_snapshots())
+    
+    lines = []
+    for metric in ALL_METRICS:
+        # Counters and histograms of exited workers still count, so totals never go backwards
+        snapshots = [snapshot[metric.name] for alive, snapshot in processes
+                     if metric.name in snapshot and (alive or not isinstance(metric, Gauge))]
+        lines.extend(metric.render(snapshots))
+    return current_app.response_class('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+@collector.route('/stats', methods=['GET'])
 def get_stats():
     """Get statistics about stored logs"""
     try:
         if not MONGODB_CONNECTED or logs_collection is None:
             return jsonify({"error": "Database not available"}), 503
         
+        entry = response_cache.get_view(('stats',))
+        if entry is not None:
+            return cached_json_response(entry)
+        generation = response_cache.generation
+        
         total = logs_collection.count_documents({})
         
         # Get unique hostnames
@@ -408,25 +1686,47 @@ def get_stats():
         recent = list(logs_collection.find({}, {'_id': 0, 'run_id': 1, 'receipt_timestamp': 1, 'overview.hostname': 1})
                      .sort('receipt_timestamp', -1).limit(10))
         
-        response = jsonify({
+        entry = ResponseCache.make_entry({
             'total_logs': total,
             'unique_hosts': len(hostnames),
             'hosts': hostnames,
             'recent_runs': recent
-        })
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response, 200
+        }, datetime.now(timezone.utc))
+        response_cache.put_view(('stats',), entry, generation)
+        return cached_json_response(entry)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def create_app():
+    """WSGI application factory, e.g. `gunicorn 'server:create_app()'`
+
+    Creating an app does not touch MongoDB: each worker process connects on
+    its first request, and indexes are created once by bootstrap_indexes().
+    """
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(collector)
+    return flask_app
+
+# Module-level app for `python server.py`, `flask --app server` and existing imports
+app = create_app()
+
 if __name__ == '__main__':
+    if sys.argv[1:] == ['--bootstrap-indexes']:
+        sys.exit(0 if bootstrap_indexes() else 1)
+    
     print("🚀 LogVoyager Server Starting...")
     print(f"🗄️  Database: {DATABASE_NAME}")
     print(f"📦 Collection: {COLLECTION_NAME}")
     print(f"🌐 Server: http://0.0.0.0:5000")
     print(f"💚 Health: http://0.0.0.0:5000/")
     print(f"📮 POST: http://0.0.0.0:5000/post")
+    print(f"📦 Batch: http://0.0.0.0:5000/post/batch")
     print(f"👀 View: http://0.0.0.0:5000/view")
     print(f"📊 Stats: http://0.0.0.0:5000/stats")
+    print(f"📤 Export: http://0.0.0.0:5000/export")
+    print(f"📈 Metrics: http://0.0.0.0:5000/metrics")
+    print(f"🔥 Profiles: http://0.0.0.0:5000/profiles?command=...")
+    print("   Development server, see gunicorn.conf.py for production")
     
+    init_mongodb(with_indexes=True)
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file